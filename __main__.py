@@ -1,4 +1,11 @@
-import news_bot
+import sys
+from startup import PROFILER
+
+# The imports are timed from the very start, before the arguments are parsed.
+if '--startup-profile' in sys.argv:
+    PROFILER.install()
+
+import news_bot  # noqa: E402
 
 
 def main():
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of the CodeProject parser against the saved fixture pages.
+
+Usage:
+    $ cd <project_root>
+    $ python benchmarks/parser_bench.py [--rounds 200] [fixture.html ...]
+"""
+import argparse
+import datetime
+import glob
+import os
+import sys
+import timeit
+from lxml import html
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from news.feeds import CodeProject  # noqa: E402
+from news.item import NewsItem  # noqa: E402
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'code_project_*.html')
+
+
+def reference_parse(content: bytes):
+    """
+    The original parser, string XPath queries per row, kept as the correctness and speed baseline.
+    """
+    nodes = html.fromstring(content)
+    node_items = nodes.xpath('//table[@class="feature news"]//tr')[1:]
+    items = []
+    for item in node_items:
+        title = item.xpath('.//td//div[@class="hover-container"]//a[@class="NewsHL"]')
+        subtitle = item.xpath('.//td//div[@class="hover-container"]//div[@class="NewsBL"]')
+        metadata = item.xpath('.//td[@class="small-text"]')
+        url = item.xpath('.//td[@class="small-text"]//a')
+
+        if not title or not subtitle or len(metadata) != 4 or not url:
+            continue
+
+        item_type, date = metadata[0].text, metadata[2].text
+        if item_type == 'Hot Threads':
+            continue
+
+        items.append(NewsItem(title[0].text, subtitle[0].text.strip(), url[0].get('href'), url[0].text, item_type,
+                              date))
+    return items
+
+
+def reference_pick(items, min_date: datetime.date):
+    """
+    The original picker, parsing the date of every item.
+    """
+    return [item for item in items if datetime.datetime.strptime(item.date, "%d %b %Y").date() >= min_date]
+
+
+def fields(items):
+    return [(i.title, i.subtitle, i.url, i.source, i.item_type, i.date) for i in items]
+
+
+def main():
+    args = argparse.ArgumentParser(prog="parser_bench")
+    args.add_argument('fixtures', nargs='*', help='The saved pages to parse, defaults to the bundled fixtures')
+    args.add_argument('--rounds', type=int, default=200, help='How many times each page is parsed')
+    args = args.parse_args()
+
+    min_date = datetime.date(2026, 10, 16)
+    for path in args.fixtures or sorted(glob.glob(FIXTURES)):
+        with open(path, 'rb') as fixture:
+            content = fixture.read()
+
+        expected = fields(reference_pick(reference_parse(content), min_date))
+        actual = fields(CodeProject._pick(CodeProject._parse(content), min_date))
+        if actual != expected:
+            sys.exit(f'{path}: parser output differs from the reference parser')
+
+        reference = timeit.timeit(lambda: reference_pick(reference_parse(content), min_date), number=args.rounds)
+        current = timeit.timeit(lambda: CodeProject._pick(CodeProject._parse(content), min_date), number=args.rounds)
+        print(f'{os.path.basename(path)}: {len(expected)} items, '
+              f'reference {reference / args.rounds * 1000:.3f}ms, '
+              f'current {current / args.rounds * 1000:.3f}ms, '
+              f'speedup x{reference / current:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+End to end benchmark of the news pipeline, run fully offline.
+
+The real NewsBot runs its collection cycles and the real Bot posts the batches through its queue. The rows of the
+recorded feed pages in benchmarks/fixtures are replayed to the requested scale by a local stub HTTP server, which
+also serves the favicons, the Imgur API, the discord REST API and the discord webhooks with a configurable latency
+and rate of 429 responses. Only the discord gateway connection is simulated in process.
+
+Usage:
+    $ cd <project_root>
+    $ python benchmarks/pipeline_bench.py [--guilds 50] [--items 200] [--latency 20] [--rate-limit 0.01] ...
+"""
+import argparse
+import asyncio
+import copy
+import datetime
+import glob
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import discord.http
+import imgurpython.client
+import yaml
+from aiohttp import web
+from discord import HTTPException
+from lxml import etree, html
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bot import Bot  # noqa: E402
+from logger import Logger  # noqa: E402
+from news_bot import NewsBot  # noqa: E402
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'code_project_*.html')
+ROWS = etree.XPath('//table[@class="feature news"]//tr')
+REACTIONS = ['\U0001F4AF', '\U0001F642', '\U0001F622', '\U0001F914', '\U0001F440']
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = 0.0
+        self.latencies = []
+        self.items = 0
+        self.sends = 0
+        self.delivered = 0
+        self.reactions = 0
+        self.rate_limited = 0
+
+
+class FakeResponse:
+    status = 429
+    reason = 'Too Many Requests'
+
+    def __init__(self, retry_after: float):
+        self.headers = {'Retry-After': str(retry_after), 'X-RateLimit-Remaining': '0',
+                        'X-RateLimit-Reset-After': str(retry_after)}
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.name = 'programming-news'
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f'guild-{guild_id}'
+        self.channels = [FakeChannel(guild_id)]
+        self.emojis = []
+
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel, message_id: int, bot: 'BenchBot'):
+        self.id = message_id
+        self.channel = channel
+        self._bot = bot
+
+    async def add_reaction(self, emoji):
+        await self._bot.simulate_reaction()
+
+
+class BenchBot(Bot):
+    """
+    The real bot, over a simulated gateway connection. The messages go to the stub discord REST API, the reactions,
+    which discord.py adds, are simulated in process.
+    """
+
+    def __init__(self, token: str, config, outbox, stats: Stats, args, loop=None):
+        super().__init__(token, config, outbox, loop=loop)
+        self._stats = stats
+        self._fake_guilds = [FakeGuild(i) for i in range(args.guilds)]
+        self._fake_ready = asyncio.Event()
+        self._reaction_latency = args.latency / 1000
+        self._connect_delay = args.connect_delay
+        self._reaction_rate_limit = args.rate_limit
+        self._reaction_rnd = random.Random(args.seed)
+
+    @property
+    def guilds(self):
+        return self._fake_guilds
+
+    async def login(self, token, *, bot=True):
+        self.http.token = token
+
+    async def connect(self, *, reconnect=True):
+        await asyncio.sleep(self._connect_delay)
+        # As discord.py does, the client is ready before the ready event handlers run in their own task.
+        self._fake_ready.set()
+        self.dispatch('ready')
+        while not self.is_closed():
+            await asyncio.sleep(0.1)
+
+    def is_ready(self):
+        return self._fake_ready.is_set()
+
+    async def wait_until_ready(self):
+        await self._fake_ready.wait()
+
+    async def post(self, batch):
+        self._stats.started_at = time.perf_counter()
+        self._stats.items += len(batch)
+        await super().post(batch)
+
+    async def simulate_reaction(self):
+        await asyncio.sleep(self._reaction_latency)
+        if self._reaction_rnd.random() < self._reaction_rate_limit:
+            self._stats.rate_limited += 1
+            raise HTTPException(FakeResponse(self._reaction_latency), 'You are being rate limited.')
+        self._stats.reactions += 1
+
+    def _create_message(self, channel, data):
+        return FakeMessage(channel, int(data['id']), self)
+
+
+class BenchNewsBot(NewsBot):
+    """
+    The real news bot, reporting each collection cycle once its batches are posted.
+    """
+
+    def __init__(self, args, bench_args, stats: Stats):
+        self._bench_args = bench_args
+        self._stats = stats
+        self._cycle = 0
+        super().__init__(args)
+
+    def _create_bot(self):
+        return BenchBot(self._args.token, self._config, self._outbox, self._stats, self._bench_args, loop=self._loop)
+
+    async def _collect_cycle(self):
+        self._stats.reset()
+        started_at = time.perf_counter()
+        await super()._collect_cycle()
+        collected_at = time.perf_counter()
+        await self._bot.wait_until_posted()
+        finished_at = time.perf_counter()
+
+        stats, guilds = self._stats, self._bench_args.guilds
+        print(f'cycle {self._cycle}: {stats.items} new items, {guilds} guilds')
+        print(f'  fetch+parse+dedup+icons+embed {(collected_at - started_at) * 1000:10.1f}ms')
+        print(f'  post                          {(finished_at - collected_at) * 1000:10.1f}ms '
+              f'({stats.sends} messages, {stats.reactions} reactions, {stats.rate_limited} rate limited)')
+        print(f'  delivered                     {stats.delivered} of {stats.items * guilds} items')
+        print(f'  throughput                    {stats.items * guilds / (finished_at - started_at):10.1f} items/sec')
+        print(f'  post latency                  p50 {percentile(stats.latencies, 0.5) * 1000:.1f}ms '
+              f'p99 {percentile(stats.latencies, 0.99) * 1000:.1f}ms')
+
+        self._cycle += 1
+        self._is_active = self._cycle < self._bench_args.cycles
+
+
+def load_rows(paths) -> list:
+    """
+    Loads the news rows of the recorded feed pages, the rows the parser skips are left out.
+    """
+    rows = []
+    for path in paths:
+        with open(path, 'rb') as fixture:
+            for row in ROWS(html.fromstring(fixture.read()))[1:]:
+                metadata = row.xpath('.//td[@class="small-text"]')
+                if len(metadata) == 4 and metadata[0].text != 'Hot Threads' and metadata[1].xpath('.//a') and \
+                        row.xpath('.//a[@class="NewsHL"]') and row.xpath('.//div[@class="NewsBL"]'):
+                    rows.append(row)
+    return rows
+
+
+def render_pages(args, paths) -> list:
+    """
+    Renders the feed page of every cycle, replaying the recorded rows up to the requested amount of items. Each copy
+    of a row gets its own title and link, so it's a new item rather than a duplicate, and is dated today.
+    """
+    rows = load_rows(paths)
+    if not rows:
+        sys.exit('No recorded feed pages, see benchmarks/record_fixtures.py')
+
+    with open(paths[0], 'rb') as fixture:
+        document = html.fromstring(fixture.read())
+    table_rows = ROWS(document)
+    for row in table_rows[1:]:
+        row.getparent().remove(row)
+    table_rows[0].addnext(etree.Comment('rows'))
+    prefix, suffix = etree.tostring(document, encoding='unicode').split('<!--rows-->')
+
+    today = datetime.date.today().strftime('%d %b %Y')
+    pages = []
+    for cycle in range(args.cycles):
+        rendered = []
+        for index in range(args.items):
+            row = copy.deepcopy(rows[index % len(rows)])
+            title = row.xpath('.//a[@class="NewsHL"]')[0]
+            title.text = f'{title.text} [{cycle}-{index}]'
+            metadata = row.xpath('.//td[@class="small-text"]')
+            link = metadata[1].xpath('.//a')[0]
+            link.set('href', f'http://127.0.0.{2 + index % args.origins}:{args.port}/news/{cycle}/{index}')
+            metadata[2].text = today
+            rendered.append(etree.tostring(row, encoding='unicode'))
+        pages.append((prefix + ''.join(rendered) + suffix).encode('utf-8'))
+    return pages
+
+
+def create_stub_app(args, stats: Stats, pages: list) -> web.Application:
+    """
+    Creates the stub server for the feed pages, the websites of the items, the Imgur API and the discord REST API and
+    webhooks.
+    """
+    rnd = random.Random(args.seed)
+    buffer = io.BytesIO()
+    Image.new('RGBA', (32, 32), (255, 128, 0, 255)).save(buffer, 'ICO')
+    favicon = buffer.getvalue()
+    polls = iter(range(len(pages)))
+
+    async def feed(request):
+        return web.Response(body=pages[min(next(polls, len(pages) - 1), len(pages) - 1)], content_type='text/html')
+
+    async def homepage(request):
+        return web.Response(text='<html><head><link rel="icon" href="/static/favicon.ico"></head></html>',
+                            content_type='text/html')
+
+    async def icon(request):
+        # Every website gets its own icon, so each one is hashed and uploaded once.
+        return web.Response(body=favicon + request.host.encode(), content_type='image/x-icon')
+
+    async def credits(request):
+        return web.json_response({'data': {}, 'success': True})
+
+    async def upload(request):
+        await request.post()
+        return web.json_response({'data': {'link': f'https://i.imgur.com/{random.getrandbits(32):x}.png'},
+                                  'success': True})
+
+    async def message(request):
+        body = await request.json()
+        await asyncio.sleep(args.latency / 1000)
+        retry_after = str(args.latency / 1000)
+        if rnd.random() < args.rate_limit:
+            stats.rate_limited += 1
+            return web.json_response({'message': 'You are being rate limited.', 'retry_after': args.latency / 1000},
+                                     status=429, headers={'Retry-After': retry_after, 'X-RateLimit-Remaining': '0',
+                                                          'X-RateLimit-Reset-After': retry_after})
+
+        stats.sends += 1
+        stats.delivered += len(body['embeds'])
+        stats.latencies.append(time.perf_counter() - stats.started_at)
+        return web.json_response({'id': str(stats.sends)}, headers={'X-RateLimit-Remaining': '4',
+                                                                   'X-RateLimit-Reset-After': '0.0'})
+
+    app = web.Application()
+    app.router.add_get('/feed', feed)
+    app.router.add_get('/', homepage)
+    app.router.add_get('/static/favicon.ico', icon)
+    app.router.add_get('/3/credits', credits)
+    app.router.add_post('/3/upload', upload)
+    app.router.add_post('/api/v7/channels/{channel_id}/messages', message)
+    app.router.add_post('/api/webhooks/{webhook_id}/{token}', message)
+    return app
+
+
+class StubServer(threading.Thread):
+    def __init__(self, args, stats: Stats, pages: list):
+        super().__init__(daemon=True)
+        self._args = args
+        self._stats = stats
+        self._pages = pages
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._ready = threading.Event()
+
+    def run(self):
+        # The stub runs on its own loop, the blocking imgur client would otherwise deadlock the benchmark loop.
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(create_stub_app(self._args, self._stats, self._pages))
+        self._loop.run_until_complete(self._runner.setup())
+        for i in range(1 + self._args.origins):
+            self._loop.run_until_complete(web.TCPSite(self._runner, f'127.0.0.{1 + i}', self._args.port).start())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+
+    def start(self):
+        super().start()
+        self._ready.wait()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self.join()
+
+
+def percentile(values, ratio: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))] if values else 0.0
+
+
+def create_config(args) -> dict:
+    """
+    Creates the bot configuration, every guild is posted to over the stub discord REST API or its webhook.
+    """
+    stub = f'http://127.0.0.1:{args.port}'
+    if args.webhook:
+        servers = {f'webhook-{i}': {'webhook_url': f'{stub}/api/webhooks/{i}/token', 'pack_embeds': args.pack}
+                   for i in range(args.guilds)}
+    else:
+        servers = {str(i): {'channel': 'programming-news', 'pack_embeds': args.pack,
+                            'reactions': REACTIONS[:args.reactions]} for i in range(args.guilds)}
+    return {
+        'user_agent': 'NewsBot benchmark',
+        'probe_news_delay': 3600.0,
+        'config_reload_interval': 0,
+        'stop_timeout': 600.0,
+        'feeds': {'CodeProject': {'url': f'{stub}/feed', 'max_pages': 1, 'min_delay': 0.0, 'max_delay': 0.0}},
+        'delivery': {'max_concurrency': args.max_concurrency, 'max_retries': 10},
+        'servers': servers,
+    }
+
+
+def run(args, pages: list):
+    stats = Stats()
+    stub = StubServer(args, stats, pages)
+    stub.start()
+    imgurpython.client.API_URL = f'http://127.0.0.1:{args.port}/'
+    discord.http.Route.BASE = f'http://127.0.0.1:{args.port}/api/v7'
+
+    workdir = tempfile.mkdtemp(prefix='newsbot-bench-')
+    config_path = os.path.join(workdir, 'config.yaml')
+    with open(config_path, 'w') as config_file:
+        yaml.safe_dump(create_config(args), config_file, allow_unicode=True)
+
+    news_bot = BenchNewsBot(argparse.Namespace(token='bench', imgur='bench', config=config_path, icons=None,
+                                               state=os.path.join(workdir, 'state.db'), debug=False, profile=0,
+                                               profile_dir=None, startup_profile=False), args, stats)
+    try:
+        news_bot.run()
+    finally:
+        news_bot.close()
+        stub.stop()
+
+
+def main():
+    args = argparse.ArgumentParser(prog="pipeline_bench")
+    args.add_argument('fixtures', nargs='*', help='The recorded feed pages to replay, defaults to the bundled ones')
+    args.add_argument('--guilds', type=int, default=50, help='The amount of simulated guilds to post to')
+    args.add_argument('--items', type=int, default=200, help='The amount of items per feed page')
+    args.add_argument('--origins', type=int, default=20, help='The amount of distinct item websites (max 250)')
+    args.add_argument('--reactions', type=int, default=0, help='The amount of reactions per message (max 5)')
+    args.add_argument('--pack', action='store_true', help='Pack several embeds per message')
+    args.add_argument('--webhook', action='store_true', help='Post over webhooks to the stub server')
+    args.add_argument('--latency', type=float, default=20.0, help='The simulated discord latency(in ms)')
+    args.add_argument('--rate-limit', type=float, default=0.01, help='The ratio of requests answered with a 429')
+    args.add_argument('--max-concurrency', type=int, default=8, help='The global cap of requests in flight')
+    args.add_argument('--connect-delay', type=float, default=0.0,
+                      help='The time(in seconds) the simulated gateway takes to be ready')
+    args.add_argument('--cycles', type=int, default=2, help='The amount of cycles, the first one runs cold')
+    args.add_argument('--port', type=int, default=8765, help='The port of the stub server')
+    args.add_argument('--seed', type=int, default=0, help='The seed of the simulated rate limits')
+    args = args.parse_args()
+
+    os.makedirs(Logger.DEFAULT_PATH, exist_ok=True)
+    Logger.get_logger()
+    logging.getLogger(Logger.NAME).setLevel(logging.WARNING)
+
+    # The pages are rendered up front, so the stub does not weigh on the measured memory.
+    pages = render_pages(args, args.fixtures or sorted(glob.glob(FIXTURES)))
+    tracemalloc.start()
+    run(args, pages)
+    current, peak = tracemalloc.get_traced_memory()
+    print(f'peak memory {peak / 1024 / 1024:.1f}MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Records the CodeProject news list pages the benchmarks replay, replacing the bundled ones.
+
+Usage:
+    $ cd <project_root>
+    $ python benchmarks/record_fixtures.py [--pages 3] [--config config/config.yaml]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import aiohttp
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from news.feeds import CodeProject  # noqa: E402
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+async def record(args):
+    with open(args.config, 'r', encoding='utf-8') as config_file:
+        user_agent = yaml.safe_load(config_file)['user_agent']
+
+    pages = []
+    async with aiohttp.ClientSession(headers={'User-Agent': user_agent}) as session:
+        for page in range(1, args.pages + 1):
+            async with session.get(CodeProject.URL, params={'pgnum': page} if page > 1 else None) as response:
+                response.raise_for_status()
+                pages.append(await response.read())
+
+    items = [CodeProject._parse(content) for content in pages]
+    if not all(items):
+        sys.exit('A recorded page holds no news items, the fixtures are left as they are')
+
+    for path in glob.glob(os.path.join(FIXTURES, 'code_project_*.html')):
+        os.remove(path)
+    for page, content in enumerate(pages, 1):
+        with open(os.path.join(FIXTURES, f'code_project_{page}.html'), 'wb') as fixture:
+            fixture.write(content)
+        print(f'code_project_{page}.html: {len(items[page - 1])} items')
+
+
+def main():
+    args = argparse.ArgumentParser(prog="record_fixtures")
+    args.add_argument('--pages', type=int, default=3, help='How many news list pages to record')
+    args.add_argument('--config', default='config/config.yaml', help='The config file, for the user agent')
+    args = args.parse_args()
+    asyncio.get_event_loop().run_until_complete(record(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,106 +1,532 @@
 import asyncio
 import codecs
-from typing import List
-from collections import namedtuple
-from discord import Client, Embed, HTTPException, Forbidden, NotFound, InvalidArgument, Message, Emoji
-from discord.abc import Messageable
+from typing import Iterable, List, Optional, Set, Union
+from collections import namedtuple, OrderedDict
+from aiohttp import ClientError
+from discord import Client, HTTPException, Forbidden, NotFound, InvalidArgument, Message, Emoji, Guild, \
+    ConnectionClosed, GatewayNotFound, LoginFailure
+from discord.abc import GuildChannel, Messageable
+from delivery import DeliveryScheduler, encode_embeds, pack_embeds
+from guild_index import GuildIndex
 from logger import Logger
+from metrics import REACTION_DURATION, SEND_DURATION, SEND_ERRORS
+from outbox import Outbox, OutboxItem
+from webhook import WebhookClient, WebhookRoute
 
 
-RoutingInfo = namedtuple('RoutingInfo', ['server', 'channel', 'reactions'])
+RoutingInfo = namedtuple('RoutingInfo', ['server', 'channel', 'reactions', 'pack_embeds'])
+Reaction = namedtuple('Reaction', ['emoji', 'printable'])
 
 
 class Bot(Client):
     _routing_info: List[RoutingInfo]
-    _batches: List[List[Embed]]
+    _batches: 'asyncio.Queue[List[OutboxItem]]'
 
-    def __init__(self, token: str, config, loop=None, **kwargs):
+    def __init__(self, token: str, config, outbox: Outbox, loop=None, **kwargs):
         super().__init__(loop=loop, **kwargs)
 
         self._token = token
         self._config = config
+        self._outbox = outbox
         self._batch_task = None
-        self._batches = []
+        self._batches = asyncio.Queue()
+        # The items a route failed to receive for a transient reason, posted again along with the next batch.
+        self._retries: 'OrderedDict[str, OutboxItem]' = OrderedDict()
         self._routing_info = []
+        self._webhook_routes = []
+        self._is_logged_in = False
+        self._is_gateway_started = False
+        self._gateway_task = None
+        # Set once the routes of the live session are resolved, the ready event fires before they are.
+        self._routes_ready = asyncio.Event()
+        self._scheduler = DeliveryScheduler(**self._config.get("delivery", {}))
+        self._webhooks = WebhookClient(self._scheduler)
+        self._guild_index = GuildIndex()
         self._logger = Logger.get_logger()
 
         self.event(self.on_ready)
+        self.event(self.on_resumed)
+        self.event(self.on_disconnect)
+        self.event(self.on_guild_join)
+        self.event(self.on_guild_available)
+        self.event(self.on_guild_remove)
+        self.event(self.on_guild_update)
+        self.event(self.on_guild_emojis_update)
+        self.event(self.on_guild_channel_create)
+        self.event(self.on_guild_channel_delete)
+        self.event(self.on_guild_channel_update)
 
-    async def run(self, batch, *args, **kwargs):
+    async def serve(self):
         """
-        Runs the bot.
+        Starts posting the queued batches. A single connection to the discord servers is kept alive for the servers
+        that need it, reconnecting with an exponential backoff.
         """
-        self._batches.append(batch)
-        await self.start(self._token, *args, **kwargs)
+        await self._webhooks.open()
+        self._webhook_routes = self._create_webhook_routes()
+        self._batch_task = asyncio.ensure_future(self._handle_batches())
+        if not self._is_gateway_required():
+            self._logger.info("Every server is reached over webhooks, skipping the discord connection.")
+            return
+
+        await self._serve_gateway()
+
+    async def post(self, batch: List[OutboxItem]):
+        """
+        Queues a batch for posting on the live connection.
+        :param batch: The outbox items to post, already journaled in the outbox.
+        """
+        await self._batches.put(batch)
+
+    async def wait_until_posted(self):
+        """
+        Waits for the queued batches to be posted.
+        """
+        await self._batches.join()
+
+    async def update_servers(self, servers: dict):
+        """
+        Applies a new server configuration, only the routes of the changed servers are rebuilt and the discord
+        connection is kept.
+        :param servers: The new server configuration.
+        """
+        current = self._config["servers"]
+        changed = [server_id for server_id in sorted(set(current) | set(servers))
+                   if current.get(server_id) != servers.get(server_id)]
+        self._config["servers"] = servers
+        if not changed:
+            return
+
+        self._webhook_routes = self._create_webhook_routes()
+        for server_id in changed:
+            server = self.get_guild(int(server_id)) if server_id.isdigit() else None
+            if server:
+                self._refresh_route(server)
+
+        self._logger.info("Servers updated", changed=changed)
+        if self._is_gateway_required() and not self._is_gateway_started and not self._gateway_task:
+            self._gateway_task = asyncio.ensure_future(self._serve_gateway())
+            self._gateway_task.add_done_callback(self._on_gateway_done)
+
+    def _on_gateway_done(self, task: asyncio.Future):
+        """
+        Logs the failure of the discord connection started on a configuration reload, nothing awaits it.
+        :param task: The connection task.
+        """
+        if not task.cancelled() and task.exception():
+            self._logger.error("Discord connection failed", ex=task.exception())
+
+    async def _serve_gateway(self):
+        """
+        Keeps the connection to the discord servers alive, reconnecting with an exponential backoff.
+        """
+        self._is_gateway_started = True
+        reconnect = self._config.get("reconnect", {})
+        min_delay = reconnect.get("min_delay", 1.0)
+        max_delay = reconnect.get("max_delay", 300.0)
+        delay = min_delay
+
+        while not self.is_closed():
+            try:
+                if not self._is_logged_in:
+                    await self.login(self._token)
+                    self._is_logged_in = True
+
+                await self.connect(reconnect=True)
+            except LoginFailure:
+                self._logger.error("Invalid discord token, giving up.")
+                raise
+            except (OSError, ClientError, HTTPException, GatewayNotFound, ConnectionClosed) as e:
+                if self.is_closed():
+                    break
+
+                self._logger.error("Discord connection lost, reconnecting", delay=delay, ex=e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+            else:
+                delay = min_delay
+
+    async def stop(self):
+        """
+        Waits for the queued batches to be posted and disconnects from the discord servers. The batches that are not
+        posted within the stop timeout, or while the discord connection is not ready, are recovered on the next start.
+        """
+        if self._batch_task:
+            if self._routes_ready.is_set() or not self._is_gateway_required():
+                try:
+                    await asyncio.wait_for(self.wait_until_posted(), self._config.get("stop_timeout", 30.0))
+                except asyncio.TimeoutError:
+                    self._logger.error("Timed out posting the queued batches, they are posted on the next start",
+                                       batch_count=self._batches.qsize())
+            self._batch_task.cancel()
+
+        await self._webhooks.close()
+        await self.logout()
+        self._logger.info("Disconnected from discord servers.")
 
     async def on_ready(self):
         """
-        Ready event, fires once the bot is connected to the discord servers.
+        Ready event, fires whenever a new session is established with the discord servers.
         """
         self._logger.info("Connected to discord servers.")
 
+        self._guild_index.clear()
         servers = self._config["servers"]
-        for server in [s for s in self.guilds if str(s.id) in servers]:
-            server_info = servers[str(server.id)]
-            channel = next(iter([c for c in server.channels if c.name == server_info["channel"]]), None)
-            if not channel:
-                self._logger.debug("Channel not found in server.", server=server.name)
-                continue
+        routes = [self._create_route(server) for server in self.guilds if str(server.id) in servers]
+        self._routing_info = [route for route in routes if route]
+        self._routes_ready.set()
 
-            self._logger.debug("Adding server to posting list", server=server.name, channel=channel.name)
-            self._routing_info.append(RoutingInfo(server, channel, server_info["reactions"]))
+    async def on_resumed(self):
+        """
+        Resumed event, the session and the routes of its guilds are kept.
+        """
+        self._logger.info("Reconnected to discord servers.")
+        self._routes_ready.set()
 
-        self._batch_task = asyncio.ensure_future(self._handle_batches())
+    async def on_disconnect(self):
+        """
+        Disconnect event, the batches wait for the session to be resumed or established again.
+        """
+        self._routes_ready.clear()
+
+    async def on_guild_join(self, guild: Guild):
+        """
+        Guild join event, resolves the route of the guild if it's configured.
+        """
+        self._refresh_route(guild)
+
+    async def on_guild_available(self, guild: Guild):
+        """
+        Guild available event, resolves the route of the guild again once it's back from an outage.
+        """
+        self._guild_index.invalidate_channels(guild)
+        self._guild_index.invalidate_emojis(guild)
+        self._refresh_route(guild)
+
+    async def on_guild_remove(self, guild: Guild):
+        """
+        Guild remove event, drops the route of the guild.
+        """
+        self._guild_index.invalidate_channels(guild)
+        self._guild_index.invalidate_emojis(guild)
+        self._routing_info = [route for route in self._routing_info if route.server.id != guild.id]
+
+    async def on_guild_update(self, before: Guild, after: Guild):
+        """
+        Guild update event, re-resolves the route of the guild.
+        """
+        self._guild_index.invalidate_channels(after)
+        self._guild_index.invalidate_emojis(after)
+        self._refresh_route(after)
+
+    async def on_guild_emojis_update(self, guild: Guild, before: List[Emoji], after: List[Emoji]):
+        """
+        Guild emojis update event, re-resolves the reactions of the guild route.
+        """
+        self._guild_index.invalidate_emojis(guild)
+        self._refresh_route(guild)
+
+    async def on_guild_channel_create(self, channel: GuildChannel):
+        """
+        Channel create event, re-resolves the route of the channel guild.
+        """
+        self._guild_index.invalidate_channels(channel.guild)
+        self._refresh_route(channel.guild)
+
+    async def on_guild_channel_delete(self, channel: GuildChannel):
+        """
+        Channel delete event, re-resolves the route of the channel guild.
+        """
+        self._guild_index.invalidate_channels(channel.guild)
+        self._refresh_route(channel.guild)
+
+    async def on_guild_channel_update(self, before: GuildChannel, after: GuildChannel):
+        """
+        Channel update event, re-resolves the route of the channel guild.
+        """
+        self._guild_index.invalidate_channels(after.guild)
+        self._refresh_route(after.guild)
+
+    def _refresh_route(self, server: Guild):
+        """
+        Re-resolves the route of a single guild, leaving the other routes untouched.
+        :param server: The guild.
+        """
+        routes = [route for route in self._routing_info if route.server.id != server.id]
+        route = self._create_route(server) if str(server.id) in self._config["servers"] else None
+        if route:
+            routes.append(route)
+        self._routing_info = routes
+
+    def _create_route(self, server: Guild) -> Optional[RoutingInfo]:
+        """
+        Resolves the route of a guild, its channel and its reactions.
+        :param server: The guild.
+        :return: The route, or None if the guild is not posted to through the discord connection.
+        """
+        server_info = self._config["servers"][str(server.id)]
+        if self._is_webhook_server(server_info):
+            return None
+
+        channel = self._guild_index.get_channel(server, server_info["channel"])
+        if not channel:
+            self._logger.debug("Channel not found in server.", server=server.name)
+            return None
+
+        reactions = server_info.get("reactions") or []
+        is_packed = server_info.get("pack_embeds", False)
+        if is_packed and reactions:
+            self._logger.info("Reactions are configured, posting one embed per message", server=server.name)
+            is_packed = False
+
+        self._logger.debug("Adding server to posting list", server=server.name, channel=channel.name)
+        return RoutingInfo(server, channel, self._parse_reactions(server, reactions), is_packed)
+
+    def _parse_reactions(self, server: Guild, reactions: List[str]) -> List[Reaction]:
+        """
+        Parses the configured reactions of a guild once, resolving its custom emojis.
+        :param server: The guild.
+        :param reactions: The reaction data.
+        :return: The parsed reactions, without the custom emojis that are missing.
+        """
+        parsed = []
+        for reaction in reactions:
+            reaction_printable = codecs.encode(bytes(reaction, 'utf-8'), 'hex') if len(reaction) == 1 else reaction
+            if reaction.startswith(':') and reaction.endswith(':'):
+                emoji = self._guild_index.get_emoji(server, reaction[1:-1])
+            else:
+                emoji = reaction
+
+            if not emoji:
+                self._logger.error("Emoji not found", server=server.name, reaction=reaction_printable)
+                continue
+
+            parsed.append(Reaction(emoji, reaction_printable))
+        return parsed
 
     async def _handle_batches(self):
         """
-        Actively handles the batches until empty.
+        Actively handles the queued batches for as long as the bot is alive.
+        The items a route failed to receive for a transient reason stay journaled and are posted again along with the
+        next batch, the routes that already received them are skipped.
         """
-        while len(self._batches) > 0:
-            batch = self._batches.pop(0)
+        while True:
+            batch = await self._batches.get()
+            try:
+                if self._is_gateway_required():
+                    await self._routes_ready.wait()
 
-            for route in self._routing_info:
-                try:
-                    for item in batch:
-                        self._logger.info("Posting item", title=item.title,
-                                          server=route.server.name, channel=route.channel.name)
-                        channel: Messageable = route.channel
-                        msg = await channel.send(embed=item)
-
-                        for reaction in route.reactions:
-                            await self._add_reaction(msg, route.server.emojis, reaction)
-                except Forbidden:
-                    self._logger.error("Improper permissions, unable to send batch", server=route.server.name,
-                                       channel=route.channel.name)
-                except NotFound:
-                    self._logger.error("Channel not found", server=route.server.name, channel=route.channel.name)
-                except HTTPException as e:
-                    self._logger.error("HTTP error", server=route.server.name, channel=route.channel.name, ex=e)
-                except InvalidArgument as e:
-                    self._logger.error("Invalid argument", server=route.server.name, channel=route.channel.name, ex=e)
+                batch = self._take_retries(batch)
+                routes = self._routing_info + self._webhook_routes
+                if not routes and self._config["servers"]:
+                    self._logger.error("No route to post to, the batch is posted along with the next one",
+                                       item_count=len(batch))
+                    self._retries.update((item.key, item) for item in batch)
+                    continue
 
-        await self.logout()
-        self._logger.info("Disconnected from discord servers.")
+                failed: Set[str] = set()
+                await self._scheduler.fan_out(routes, lambda route: self._handle_route(route, batch, failed),
+                                              key=self._get_route_key)
+                self._outbox.complete(item.key for item in batch if item.key not in failed)
+                if failed:
+                    self._logger.info("Delivery failed, posting along with the next batch", item_count=len(failed))
+                    self._retries.update((item.key, item) for item in batch if item.key in failed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The batch stays journaled, it is posted on the next start.
+                self._logger.error("Unable to post batch", item_count=len(batch), ex=e)
+            finally:
+                self._batches.task_done()
 
-    async def _add_reaction(self, message: Message, emojis: List[Emoji], reaction: str):
+    def _take_retries(self, batch: List[OutboxItem]) -> List[OutboxItem]:
         """
-        Parses the reaction and adds it to the message.
-        :param message: The message object, to attach the reaction to.
-        :param emojis: The list of custom emojis that belong to the server.
-        :param reaction: The reaction data.
+        Takes the items to post again ahead of a batch.
+        :param batch: The outbox items of the batch.
+        :return: The items to post again followed by the batch.
         """
-        if reaction.startswith(':') and reaction.endswith(':'):
-            emoji = next(iter([e for e in emojis if e.name == reaction[1:-1]]), None)
-        else:
-            emoji = reaction
+        retries = list(self._retries.values())
+        batch = [item for item in batch if item.key not in self._retries]
+        self._retries.clear()
+        return retries + batch
 
-        reaction_printable = codecs.encode(bytes(reaction, 'utf-8'), 'hex') if len(reaction) == 1 else reaction
-        if not emoji:
-            self._logger.error("Emoji not found", message=message.id, reaction=reaction_printable)
+    def _add_undelivered(self, failed: Set[str], batch: Iterable[OutboxItem], route_key: str):
+        """
+        Adds the items of a batch which did not reach a route to the failed items.
+        :param failed: The keys of the failed items.
+        :param batch: The outbox items posted to the route.
+        :param route_key: The route key.
+        """
+        failed.update(item.key for item in batch if not self._outbox.is_delivered(item.key, route_key))
+
+    async def _handle_route(self, route: Union[RoutingInfo, WebhookRoute], batch: List[OutboxItem],
+                            failed: Set[str]):
+        """
+        Posts a batch to a single route, keeping the order of the items within the channel.
+        Items that already reached the route before a restart are skipped.
+        :param route: The route to post to.
+        :param batch: The outbox items to post.
+        :param failed: The keys of the items that failed for a transient reason, the undelivered items are added.
+        """
+        if isinstance(route, WebhookRoute):
+            await self._handle_webhook_route(route, batch, failed)
             return
 
+        route_key = self._get_route_key(route)
+        batch = [item for item in batch if not self._outbox.is_delivered(item.key, route_key)]
+        try:
+            if route.pack_embeds:
+                await self._handle_packed_route(route, batch)
+                return
+
+            for item in batch:
+                self._logger.info("Posting item", title=item.embed.title,
+                                  server=route.server.name, channel=route.channel.name)
+                with SEND_DURATION.time(transport='gateway'):
+                    data = await self._send_message(route.channel, encode_embeds([item.payload]))
+                self._outbox.mark_delivered([item.key], route_key)
+
+                if route.reactions:
+                    msg = self._create_message(route.channel, data)
+                    for reaction in route.reactions:
+                        await self._add_reaction(msg, reaction)
+        except Forbidden:
+            SEND_ERRORS.inc(transport='gateway')
+            self._logger.error("Improper permissions, unable to send batch", server=route.server.name,
+                               channel=route.channel.name)
+        except NotFound:
+            SEND_ERRORS.inc(transport='gateway')
+            self._logger.error("Channel not found", server=route.server.name, channel=route.channel.name)
+        except HTTPException as e:
+            SEND_ERRORS.inc(transport='gateway')
+            self._logger.error("HTTP error", server=route.server.name, channel=route.channel.name, ex=e)
+            if self._is_transient(e):
+                self._add_undelivered(failed, batch, route_key)
+        except InvalidArgument as e:
+            SEND_ERRORS.inc(transport='gateway')
+            self._logger.error("Invalid argument", server=route.server.name, channel=route.channel.name, ex=e)
+        except (ClientError, asyncio.TimeoutError) as e:
+            SEND_ERRORS.inc(transport='gateway')
+            self._logger.error("Request failed", server=route.server.name, channel=route.channel.name, ex=e)
+            self._add_undelivered(failed, batch, route_key)
+
+    async def _handle_packed_route(self, route: RoutingInfo, batch: List[OutboxItem]):
+        """
+        Posts a batch to a single route, packing as many embeds per message as allowed.
+        :param route: The route to post to.
+        :param batch: The outbox items to post.
+        """
+        for group in pack_embeds(batch, size=lambda item: len(item.embed)):
+            self._logger.info("Posting items", titles=[item.embed.title for item in group],
+                              server=route.server.name, channel=route.channel.name)
+            with SEND_DURATION.time(transport='gateway'):
+                await self._send_message(route.channel, encode_embeds(item.payload for item in group))
+            self._outbox.mark_delivered([item.key for item in group], str(route.server.id))
+
+    async def _handle_webhook_route(self, route: WebhookRoute, batch: List[OutboxItem], failed: Set[str]):
+        """
+        Posts a batch to a single route over its webhook, without a discord connection.
+        :param route: The webhook route to post to.
+        :param batch: The outbox items to post.
+        :param failed: The keys of the items that failed for a transient reason, the undelivered items are added.
+        """
+        batch = [item for item in batch if not self._outbox.is_delivered(item.key, route.server_id)]
+        groups = pack_embeds(batch, size=lambda item: len(item.embed)) if route.pack_embeds else [[i] for i in batch]
+        try:
+            for group in groups:
+                self._logger.info("Posting items over webhook", titles=[item.embed.title for item in group],
+                                  server=route.server_id)
+                with SEND_DURATION.time(transport='webhook'):
+                    await self._webhooks.send(route.url, encode_embeds(item.payload for item in group))
+                self._outbox.mark_delivered([item.key for item in group], route.server_id)
+        except Forbidden:
+            SEND_ERRORS.inc(transport='webhook')
+            self._logger.error("Improper permissions, unable to send batch", server=route.server_id)
+        except NotFound:
+            SEND_ERRORS.inc(transport='webhook')
+            self._logger.error("Webhook not found", server=route.server_id)
+        except HTTPException as e:
+            SEND_ERRORS.inc(transport='webhook')
+            self._logger.error("HTTP error", server=route.server_id, ex=e)
+            if self._is_transient(e):
+                self._add_undelivered(failed, batch, route.server_id)
+        except (ClientError, asyncio.TimeoutError) as e:
+            SEND_ERRORS.inc(transport='webhook')
+            self._logger.error("Webhook request failed", server=route.server_id, ex=e)
+            self._add_undelivered(failed, batch, route.server_id)
+
+    def _create_webhook_routes(self) -> List[WebhookRoute]:
+        """
+        Creates the routes of the servers that are reached over webhooks.
+        :return: The webhook routes.
+        """
+        return [WebhookRoute(server_id, server_info["webhook_url"], server_info.get("pack_embeds", False))
+                for server_id, server_info in self._config["servers"].items() if self._is_webhook_server(server_info)]
+
+    def _is_gateway_required(self) -> bool:
+        """
+        Checks whether any server has to be reached through the discord connection.
+        :return: True if the discord connection is required, False otherwise.
+        """
+        return not all(self._is_webhook_server(server_info) for server_info in self._config["servers"].values())
+
+    @staticmethod
+    def _get_route_key(route: Union[RoutingInfo, WebhookRoute]) -> str:
+        """
+        Gets the key of a route, the id of its server.
+        :param route: The route.
+        :return: The route key.
+        """
+        return route.server_id if isinstance(route, WebhookRoute) else str(route.server.id)
+
+    @staticmethod
+    def _is_transient(e: HTTPException) -> bool:
+        """
+        Checks whether a failed request may succeed later, when it was still rate limited or the server failed.
+        :param e: The HTTP exception.
+        :return: True if the request may be retried, False otherwise.
+        """
+        return e.status == 429 or e.status >= 500
+
+    @staticmethod
+    def _is_webhook_server(server_info: dict) -> bool:
+        """
+        Checks whether a server is reached over its webhook, reactions can only be added through the connection.
+        :param server_info: The server configuration.
+        :return: True if the server is reached over its webhook, False otherwise.
+        """
+        return bool(server_info.get("webhook_url")) and not server_info.get("reactions")
+
+    async def _send_message(self, channel: Messageable, body: bytes) -> dict:
+        """
+        Sends an encoded message as is within the rate limit bucket of the channel, the high level send encodes the
+        embeds again on every call, does not support several embeds per message and hides the rate limit headers.
+        :param channel: The channel to send to.
+        :param body: The encoded message body, see encode_embeds.
+        :return: The raw message data.
+        """
+        headers = {'Authorization': f'Bot {self.http.token}', 'User-Agent': self.http.user_agent,
+                   'X-Ratelimit-Precision': 'millisecond'}
+        return await self._webhooks.send_message(channel.id, body, headers)
+
+    def _create_message(self, channel: Messageable, data: dict) -> Message:
+        """
+        Creates the message object of a sent message, only needed to add its reactions.
+        :param channel: The channel the message was sent to.
+        :param data: The raw message data.
+        :return: The message object.
+        """
+        return self._connection.create_message(channel=channel, data=data)
+
+    async def _add_reaction(self, message: Message, reaction: Reaction):
+        """
+        Adds the reaction to the message.
+        :param message: The message object, to attach the reaction to.
+        :param reaction: The parsed reaction.
+        """
+        emoji, reaction_printable = reaction
         try:
-            await message.add_reaction(emoji)
+            with REACTION_DURATION.time():
+                await self._scheduler.call((message.channel.id, 'reactions'), lambda: message.add_reaction(emoji))
         except Forbidden:
             self._logger.error("Improper permissions, unable to add reaction", message=message.id,
                                reaction=reaction_printable)
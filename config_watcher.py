@@ -0,0 +1,49 @@
+import asyncio
+import os
+from logger import Logger
+from typing import Awaitable, Callable, Optional, Tuple
+
+
+class ConfigWatcher:
+    def __init__(self, path: str, load: Callable[[str], Optional[dict]], interval: float = 5.0):
+        self._path = path
+        self._load = load
+        self._interval = interval
+        self._logger = Logger.get_logger()
+
+    async def watch(self, on_change: Callable[[dict], Awaitable[None]]):
+        """
+        Polls the configuration file for changes, a changed file is parsed off the event loop. A configuration that
+        fails to load or to apply is logged and the polling goes on.
+        :param on_change: The coroutine function the new configuration is handed to.
+        """
+        loop = asyncio.get_event_loop()
+        version = self._get_version()
+        while True:
+            await asyncio.sleep(self._interval)
+            current_version = self._get_version()
+            if current_version == version:
+                continue
+
+            version = current_version
+            config = await loop.run_in_executor(None, self._load, self._path)
+            if not config or not isinstance(config, dict):
+                self._logger.error("Invalid configuration file, keeping the current configuration", path=self._path)
+                continue
+
+            self._logger.info("Configuration file changed, reloading", path=self._path)
+            try:
+                await on_change(config)
+            except Exception as e:
+                self._logger.error("Unable to apply the configuration file", path=self._path, ex=e)
+
+    def _get_version(self) -> Optional[Tuple[int, int]]:
+        """
+        Gets the version of the configuration file, as its modification time and size.
+        :return: The file version, or None if the file is missing.
+        """
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, TypeVar
+from discord import HTTPException
+from logger import Logger
+from metrics import RATE_LIMITED
+
+
+T = TypeVar('T')
+
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+
+def encode_embeds(payloads: Iterable[bytes]) -> bytes:
+    """
+    Encodes the body of a message from embeds that are already encoded.
+    :param payloads: The encoded embeds.
+    :return: The encoded message body.
+    """
+    return b'{"embeds":[' + b','.join(payloads) + b']}'
+
+
+def pack_embeds(embeds: List[T], max_embeds: int = MAX_EMBEDS_PER_MESSAGE,
+                max_chars: int = MAX_EMBED_CHARS_PER_MESSAGE, size: Callable[[T], int] = len) -> List[List[T]]:
+    """
+    Packs the embeds, in order, into as few messages as the discord limits allow.
+    :param embeds: The embeds to pack.
+    :param max_embeds: The maximum number of embeds per message.
+    :param max_chars: The maximum number of characters across all the embeds of a message.
+    :param size: Gets the number of characters of an embed.
+    :return: The embed groups, one per message.
+    """
+    groups = []
+    group, group_chars = [], 0
+    for embed in embeds:
+        embed_chars = size(embed)
+        if group and (len(group) == max_embeds or group_chars + embed_chars > max_chars):
+            groups.append(group)
+            group, group_chars = [], 0
+
+        group.append(embed)
+        group_chars += embed_chars
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+class RateLimitBucket:
+    def __init__(self):
+        self._remaining = None
+        self._reset_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until the bucket allows another request, and accounts for it.
+        """
+        async with self._lock:
+            delay = self._reset_at - time.monotonic()
+            if self._remaining is not None and self._remaining <= 0 and delay > 0:
+                await asyncio.sleep(delay)
+
+            if self._reset_at <= time.monotonic():
+                self._remaining = None
+            elif self._remaining is not None:
+                self._remaining -= 1
+
+    def update(self, headers: Mapping[str, str]):
+        """
+        Updates the bucket state from the rate limit headers of a discord response.
+        :param headers: The response headers.
+        """
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if remaining is None or reset_after is None:
+            return
+
+        self._remaining = int(remaining)
+        self._reset_at = time.monotonic() + float(reset_after)
+
+    def back_off(self, retry_after: float):
+        """
+        Blocks the bucket after being rate limited.
+        :param retry_after: The time(in seconds) to wait before the next request.
+        """
+        self._remaining = 0
+        self._reset_at = max(self._reset_at, time.monotonic() + retry_after)
+
+
+class DeliveryScheduler:
+    def __init__(self, max_concurrency: int = 8, max_retries: int = 3):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_retries = max_retries
+        self._global_bucket = RateLimitBucket()
+        self._buckets: Dict[Hashable, RateLimitBucket] = {}
+        self._logger = Logger.get_logger()
+
+    def bucket(self, key: Hashable) -> RateLimitBucket:
+        """
+        Gets the rate limit bucket of a route.
+        :param key: The route key, e.g. the channel id.
+        :return: The rate limit bucket.
+        """
+        bucket = self._buckets.get(key)
+        if not bucket:
+            bucket = self._buckets[key] = RateLimitBucket()
+        return bucket
+
+    async def call(self, key: Hashable, request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Performs a single request within the global concurrency cap and the rate limit bucket of its route.
+        :param key: The route key, e.g. the channel id.
+        :param request: A factory for the request coroutine, invoked again on each retry.
+        :return: The result of the request.
+        """
+        bucket = self.bucket(key)
+        for attempt in range(self._max_retries + 1):
+            await self._global_bucket.acquire()
+            await bucket.acquire()
+            async with self._semaphore:
+                try:
+                    return await request()
+                except HTTPException as e:
+                    if e.status != 429 or attempt == self._max_retries:
+                        raise
+
+                    retry_after = self._get_retry_after(e)
+                    is_global = e.response.headers.get('X-RateLimit-Global') == 'true'
+                    self._logger.info("Rate limited, backing off", route=key, retry_after=retry_after,
+                                      is_global=is_global)
+                    RATE_LIMITED.inc(scope='global' if is_global else 'route')
+                    (self._global_bucket if is_global else bucket).back_off(retry_after)
+
+    async def fan_out(self, routes: Iterable[Any], deliver: Callable[[Any], Awaitable[None]],
+                      key: Callable[[Any], Hashable] = repr):
+        """
+        Delivers to all the routes concurrently, each route handles its own items in order.
+        A route that fails is logged and does not stop the delivery to the other routes.
+        :param routes: The routes to deliver to.
+        :param deliver: The delivery coroutine function of a single route.
+        :param key: Gets the key of a route, for logging.
+        """
+        routes = list(routes)
+        results = await asyncio.gather(*[deliver(route) for route in routes], return_exceptions=True)
+        for route, result in zip(routes, results):
+            if isinstance(result, Exception):
+                self._logger.error("Unable to deliver to route", route=key(route), ex=result)
+
+    @staticmethod
+    def _get_retry_after(e: HTTPException) -> float:
+        """
+        Gets the time to wait after a rate limited response.
+        :param e: The rate limit exception.
+        :return: The time(in seconds) to wait.
+        """
+        headers = e.response.headers
+        retry_after: Optional[str] = headers.get('Retry-After') or headers.get('X-RateLimit-Reset-After')
+        return float(retry_after) if retry_after else 1.0
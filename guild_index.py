@@ -0,0 +1,58 @@
+from discord import Emoji, Guild
+from discord.abc import GuildChannel
+from typing import Dict, Optional
+
+
+class GuildIndex:
+    def __init__(self):
+        self._channels: Dict[int, Dict[str, GuildChannel]] = {}
+        self._emojis: Dict[int, Dict[str, Emoji]] = {}
+
+    def get_channel(self, guild: Guild, name: str) -> Optional[GuildChannel]:
+        """
+        Gets a channel of a guild by its name, indexing the guild channels on first use.
+        :param guild: The guild.
+        :param name: The channel name.
+        :return: The first channel with that name, or None if not found.
+        """
+        channels = self._channels.get(guild.id)
+        if channels is None:
+            channels = self._channels[guild.id] = {}
+            for channel in guild.channels:
+                channels.setdefault(channel.name, channel)
+        return channels.get(name)
+
+    def get_emoji(self, guild: Guild, name: str) -> Optional[Emoji]:
+        """
+        Gets a custom emoji of a guild by its name, indexing the guild emojis on first use.
+        :param guild: The guild.
+        :param name: The emoji name.
+        :return: The first emoji with that name, or None if not found.
+        """
+        emojis = self._emojis.get(guild.id)
+        if emojis is None:
+            emojis = self._emojis[guild.id] = {}
+            for emoji in guild.emojis:
+                emojis.setdefault(emoji.name, emoji)
+        return emojis.get(name)
+
+    def invalidate_channels(self, guild: Guild):
+        """
+        Drops the channel index of a guild, it is rebuilt on next use.
+        :param guild: The guild.
+        """
+        self._channels.pop(guild.id, None)
+
+    def invalidate_emojis(self, guild: Guild):
+        """
+        Drops the emoji index of a guild, it is rebuilt on next use.
+        :param guild: The guild.
+        """
+        self._emojis.pop(guild.id, None)
+
+    def clear(self):
+        """
+        Drops the indexes of every guild.
+        """
+        self._channels.clear()
+        self._emojis.clear()
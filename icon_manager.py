@@ -1,53 +1,121 @@
-import requests
+import asyncio
+import base64
 import hashlib
-import tempfile
 import io
-import yaml
+import time
 import urllib.parse
-from PIL import Image
+from aiohttp import ClientSession, ClientTimeout
 from logger import Logger
+from metrics import ICON_CACHE
+from state_store import StateStore
 from lxml import html
-from imgurpython import ImgurClient
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
+
+if TYPE_CHECKING:
+    from imgurpython import ImgurClient
 
 
 class IconManager:
-    def __init__(self, imgur: ImgurClient, data: dict, user_agent: str):
-        self._imgur_client = imgur
-        self._hashes = data
+    def __init__(self, imgur_client_id: Optional[str], store: StateStore, user_agent: str, ttl: float = 604800.0,
+                 negative_ttl: float = 3600.0, timeout: float = 15.0):
+        self._imgur_client_id = imgur_client_id
+        self._imgur_client: Optional['ImgurClient'] = None
+        self._imgur_lock = asyncio.Lock()
+        self._store = store
         self._user_agent = user_agent
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._timeout = ClientTimeout(total=timeout)
+        self._in_flight: Dict[str, asyncio.Future] = {}
         self._logger = Logger.get_logger()
 
-    def get(self, url: str) -> str:
+    async def resolve(self, session: ClientSession, urls: Iterable[str]) -> Dict[str, Optional[str]]:
         """
-        Gets and caches the requested icon safely.
-        :param url: The url of the icon.
-        :return: The cached icon url.
+        Resolves the icons of several websites in parallel.
+        :param session: The shared HTTP session to issue the requests with.
+        :param urls: The website origins of the icons, duplicates are resolved once.
+        :return: The cached icon url of each website origin, or None if the icon could not be resolved.
+        """
+        urls = list(set(urls))
+        icons = await asyncio.gather(*[self.get(session, url) for url in urls])
+        return dict(zip(urls, icons))
+
+    async def get(self, session: ClientSession, url: str) -> Optional[str]:
+        """
+        Gets and caches the requested icon safely, concurrent requests for the same website share a single lookup.
+        :param session: The shared HTTP session to issue the requests with.
+        :param url: The website origin of the icon.
+        :return: The cached icon url, or None if the icon could not be resolved.
+        """
+        entry = self._store.get_origin(url)
+        if entry and entry[1] > time.time():
+            self._logger.debug("IconManager cache hit", url=url, icon=entry[0])
+            ICON_CACHE.inc(result='hit')
+            return entry[0]
+
+        ICON_CACHE.inc(result='miss')
+        future = self._in_flight.get(url)
+        if future:
+            return await asyncio.shield(future)
+
+        future = self._in_flight[url] = asyncio.get_event_loop().create_future()
+        try:
+            ico = await self._resolve(session, url)
+            future.set_result(ico)
+            return ico
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # A cancelled lookup leaves the waiters without an icon rather than waiting forever.
+            if not future.done():
+                future.set_result(None)
+            del self._in_flight[url]
+
+    async def _resolve(self, session: ClientSession, url: str) -> Optional[str]:
+        """
+        Resolves the icon of a website origin and caches the outcome, failures included.
+        :param session: The shared HTTP session to issue the requests with.
+        :param url: The website origin of the icon.
+        :return: The cached icon url, or None if the icon could not be resolved.
         """
         self._logger.debug("IconManager request", url=url)
         try:
-            return self._get(url)
+            ico = await self._get(session, url)
+            self._store.set_origin(url, ico, time.time() + self._ttl)
+        except asyncio.CancelledError:
+            # A cancelled lookup says nothing about the website, it's not cached as a failure.
+            raise
         except Exception as e:
             self._logger.info("IconManager failed to get icon, defaulting..", e=e)
-            return url
+            ico = None
+            self._store.set_origin(url, ico, time.time() + self._negative_ttl)
 
-    def _get(self, url: str) -> str:
+        return ico
+
+    async def _get(self, session: ClientSession, url: str) -> str:
         """
         Gets and caches the requested icon.
+        :param session: The shared HTTP session to issue the requests with.
         :param url: The url of the icon.
         :return: The cached icon url.
         """
-        url = self._get_favicon_path(url, requests.get(url, headers={'User-Agent': self._user_agent})) or f'{url}/favicon.ico'
+        loop = asyncio.get_event_loop()
+        status, content = await self._fetch(session, url)
+        favicon_url = await loop.run_in_executor(None, self._get_favicon_path, url, status, content)
+        url = favicon_url or f'{url}/favicon.ico'
         self._logger.debug('IconManager favicon url', url=url)
 
-        response = requests.get(url, headers={'User-Agent': self._user_agent})
-        if response.status_code == 200:
-            ico_hash = hashlib.sha256(response.content).hexdigest()
+        status, content = await self._fetch(session, url)
+        if status == 200:
+            ico_hash = await loop.run_in_executor(None, self._get_hash, content)
             self._logger.debug("IconManager favicon hash", icon_hash=ico_hash)
 
-            ico = self._hashes.get(ico_hash, None)
-            if not ico and self._imgur_client:
-                ico = self._cache_icon(ico_hash, response.content)
+            ico = self._store.get_icon(ico_hash)
+            if not ico and self._imgur_client_id:
+                ico = await self._cache_icon(ico_hash, content)
 
             if ico:
                 url = ico
@@ -55,27 +123,32 @@ class IconManager:
 
         return url
 
-    def save(self, target: str):
+    async def _fetch(self, session: ClientSession, url: str) -> Tuple[int, bytes]:
         """
-        Saves the cache to a disk file.
-        :param target: The target file.
+        Fetches a resource of the website.
+        :param session: The shared HTTP session to issue the requests with.
+        :param url: The url of the resource.
+        :return: The response status and body.
         """
-        with open(target, 'w+') as out:
-            yaml.dump(self._hashes, out)
+        async with session.get(url, headers={'User-Agent': self._user_agent}, timeout=self._timeout) as response:
+            return response.status, await response.read()
 
-    def _cache_icon(self, ico_hash: str, content: bytes) -> Optional[str]:
+    async def _cache_icon(self, ico_hash: str, content: bytes) -> Optional[str]:
         """
         Caches the icon and uploads it to our cache host.
         :param ico_hash: The icon hash from the original .ico file.
         :param content: The content bytes of the original .ico file.
         :return: The icon url from the cache host.
         """
+        loop = asyncio.get_event_loop()
         try:
-            if self._imgur_client:
-                temp_file_name = self._get_temp_file_name()
-                Image.open(io.BytesIO(content)).save(temp_file_name, 'PNG')
-                ico = self._imgur_client.upload_from_path(temp_file_name)['link']
-                self._hashes[ico_hash] = ico
+            imgur_client = await self._get_imgur_client()
+            if imgur_client:
+                png = await loop.run_in_executor(None, self._encode_png, content)
+                data = {'image': base64.b64encode(png), 'type': 'base64'}
+                result = await loop.run_in_executor(None, imgur_client.make_request, 'POST', 'upload', data, True)
+                ico = result['link']
+                self._store.set_icon(ico_hash, ico)
                 return ico
         except OSError:
             # The website is supplying an invalid image :(
@@ -83,18 +156,72 @@ class IconManager:
 
         return None
 
+    async def _get_imgur_client(self) -> Optional['ImgurClient']:
+        """
+        Gets the imgur client, created on the first upload since it checks the client id over the network.
+        :return: The imgur client, or None if the client id is not accepted.
+        """
+        async with self._imgur_lock:
+            if not self._imgur_client and self._imgur_client_id:
+                loop = asyncio.get_event_loop()
+                self._imgur_client = await loop.run_in_executor(None, self._create_imgur_client,
+                                                                self._imgur_client_id)
+                if not self._imgur_client:
+                    self._logger.error("Imgur client id not accepted, icons won't be uploaded")
+                    self._imgur_client_id = None
+
+        return self._imgur_client
+
     @staticmethod
-    def _get_favicon_path(url: str, response: requests.Response) -> Optional[str]:
+    def _create_imgur_client(client_id: str) -> Optional['ImgurClient']:
+        """
+        Creates the imgur client instance.
+        :param client_id: The imgur developer client id to be used.
+        :return: The ImgurClient, or None if the client id is not accepted.
+        """
+        from imgurpython import ImgurClient
+        from imgurpython.helpers.error import ImgurClientError
+
+        try:
+            return ImgurClient(client_id, None)
+        except ImgurClientError:
+            return None
+
+    @staticmethod
+    def _encode_png(content: bytes) -> bytes:
+        """
+        Re-encodes the icon as a PNG image in memory, Pillow is only loaded once an icon has to be uploaded.
+        :param content: The content bytes of the original .ico file.
+        :return: The PNG image bytes.
+        """
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.open(io.BytesIO(content)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    @staticmethod
+    def _get_hash(content: bytes) -> str:
+        """
+        Gets the hash of the icon content.
+        :param content: The content bytes of the original .ico file.
+        :return: The icon hash.
+        """
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _get_favicon_path(url: str, status: int, content: bytes) -> Optional[str]:
         """
         Gets the custom favicon path, if available.
-        :param response: The base url of the request.
-        :param response: The response class from a request.
+        :param url: The base url of the request.
+        :param status: The response status of the base url.
+        :param content: The response body of the base url.
         :return: The url to the custom favicon or None if not available.
         """
-        if response.status_code != 200:
+        if status != 200:
             return None
 
-        nodes = html.fromstring(response.content)
+        nodes = html.fromstring(content)
         icon = nodes.xpath('//link[contains(@rel, "icon") and contains(@href, "favicon")]')
         if len(icon) == 0:
             return None
@@ -104,13 +231,3 @@ class IconManager:
             return href
 
         return urllib.parse.urljoin(url, href)
-
-    @staticmethod
-    def _get_temp_file_name() -> str:
-        """
-        Gets a temporary file name.
-        :return: The temporary file name on the disk.
-        """
-        f = tempfile.NamedTemporaryFile()
-        f.close()
-        return f.name
@@ -1,7 +1,12 @@
+import atexit
+import copy
+import queue
 import structlog
 import logging
+import logging.handlers
 import os
 import datetime
+from typing import Optional
 
 
 class Logger:
@@ -9,6 +14,9 @@ class Logger:
     DEFAULT_PATH = './logs'
     IS_ROOT_SETUP = True
     IS_DEBUG = False
+    MAX_BYTES = 10 * 1024 * 1024
+    BACKUP_COUNT = 5
+    ROTATE_WHEN: Optional[str] = None
 
     @staticmethod
     def get_logger():
@@ -22,11 +30,26 @@ class Logger:
 
         return structlog.get_logger(Logger.NAME)
 
+    @staticmethod
+    def configure(max_bytes: int = None, backup_count: int = None, when: str = None):
+        """
+        Configures the log file rotation, takes effect if called before the first logger is created.
+        :param max_bytes: The size(in bytes) a log file is rotated at.
+        :param backup_count: How many rotated log files are kept.
+        :param when: The interval a log file is rotated at instead, e.g. midnight (see TimedRotatingFileHandler).
+        """
+        Logger.MAX_BYTES = Logger.MAX_BYTES if max_bytes is None else max_bytes
+        Logger.BACKUP_COUNT = Logger.BACKUP_COUNT if backup_count is None else backup_count
+        Logger.ROTATE_WHEN = when or Logger.ROTATE_WHEN
+
     @staticmethod
     def _setup_root_logger():
         """
         Setup the root logger to beautify the logging process.
+        The events below the level are dropped by the bound logger before any processing, the others are rendered and
+        written by a background thread so the event loop never waits on the console or the log file.
         """
+        level = logging.DEBUG if Logger.IS_DEBUG else logging.INFO
         structlog.configure(
             processors=[
                 structlog.stdlib.filter_by_level,
@@ -36,22 +59,52 @@ class Logger:
                 structlog.stdlib.ProcessorFormatter.wrap_for_formatter
             ],
             context_class=structlog.threadlocal.wrap_dict(dict),
-            logger_factory=structlog.stdlib.LoggerFactory()
+            logger_factory=structlog.stdlib.LoggerFactory(),
+            wrapper_class=structlog.make_filtering_bound_logger(level),
+            cache_logger_on_first_use=True
         )
         formatter = structlog.stdlib.ProcessorFormatter(
             processor=structlog.dev.ConsoleRenderer()
         )
         formatter_file = structlog.stdlib.ProcessorFormatter(
-            processor=structlog.dev.ConsoleRenderer(colors=False)
+            processor=structlog.processors.JSONRenderer(separators=(',', ':'), default=repr)
         )
 
         handler = logging.StreamHandler()
         handler.setFormatter(formatter)
-        file_handler = logging.FileHandler(os.path.join(
+        file_handler = Logger._create_file_handler(os.path.join(
             Logger.DEFAULT_PATH,
             f'{Logger.NAME}-{datetime.datetime.today().strftime("%Y-%m-%d-%H-%M-%S")}.log'))
         file_handler.setFormatter(formatter_file)
+
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, handler, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
         logger = logging.getLogger(Logger.NAME)
-        logger.addHandler(handler)
-        logger.addHandler(file_handler)
-        logger.setLevel(logging.DEBUG if Logger.IS_DEBUG else logging.INFO)
+        logger.addHandler(_EventQueueHandler(records))
+        logger.setLevel(level)
+
+    @staticmethod
+    def _create_file_handler(path: str) -> logging.Handler:
+        """
+        Creates the log file handler, rotating by time if configured and by size otherwise.
+        :param path: The log file path.
+        :return: The log file handler.
+        """
+        if Logger.ROTATE_WHEN:
+            return logging.handlers.TimedRotatingFileHandler(path, when=Logger.ROTATE_WHEN,
+                                                             backupCount=Logger.BACKUP_COUNT, encoding='utf-8')
+        return logging.handlers.RotatingFileHandler(path, maxBytes=Logger.MAX_BYTES, backupCount=Logger.BACKUP_COUNT,
+                                                    encoding='utf-8')
+
+
+class _EventQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Hands the record over as is, the structlog event is rendered by the handlers of the listener thread.
+        :param record: The log record.
+        :return: A copy of the record.
+        """
+        return copy.copy(record)
@@ -0,0 +1,222 @@
+import bisect
+import contextlib
+import threading
+import time
+from logger import Logger
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        Increments the counter.
+        :param amount: The amount to increment by.
+        :param labels: The label values.
+        """
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        """
+        Renders the counter in the Prometheus text format.
+        :return: The lines of the counter.
+        """
+        with self._lock:
+            values = list(self._values.items())
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter'] + \
+               [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in values]
+
+
+class Histogram:
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        """
+        Observes a value.
+        :param value: The observed value, usually a duration(in seconds).
+        :param labels: The label values.
+        """
+        key = tuple(str(labels[label]) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observes the duration of the block.
+        :param labels: The label values.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def render(self) -> List[str]:
+        """
+        Renders the histogram in the Prometheus text format.
+        :return: The lines of the histogram.
+        """
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels + ("le",), key + (str(bucket),))} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels + ("le",), key + ("+Inf",))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        """
+        Registers a counter.
+        :param name: The metric name.
+        :param description: The metric description.
+        :param labels: The label names.
+        :return: The counter.
+        """
+        metric = Counter(name, description, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        """
+        Registers a histogram.
+        :param name: The metric name.
+        :param description: The metric description.
+        :param labels: The label names.
+        :param buckets: The upper bounds of the buckets.
+        :return: The histogram.
+        """
+        metric = Histogram(name, description, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text format.
+        :return: The metrics page.
+        """
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+
+class MetricsServer:
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9100):
+        self._registry = registry
+        self._host = host
+        self._port = port
+        self._runner: Optional['web.AppRunner'] = None
+        self._logger = Logger.get_logger()
+
+    async def start(self):
+        """
+        Starts serving the metrics page on /metrics, the server side of aiohttp is only loaded when it's enabled.
+        The bot keeps running without the endpoint if its address can't be bound.
+        """
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self._host, self._port).start()
+        except OSError as e:
+            self._logger.error("Unable to serve the metrics, running without them", host=self._host, port=self._port,
+                               ex=e)
+            await self.stop()
+
+    async def stop(self):
+        """
+        Stops serving the metrics page.
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: 'web.Request') -> 'web.Response':
+        """
+        Serves the metrics page.
+        :param request: The HTTP request.
+        :return: The metrics page response.
+        """
+        from aiohttp import web
+
+        return web.Response(text=self._registry.render(), content_type='text/plain')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    """
+    Formats the labels of a sample.
+    :param names: The label names.
+    :param values: The label values.
+    :return: The formatted labels, or an empty string without labels.
+    """
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _escape(value: str) -> str:
+    """
+    Escapes a label value.
+    :param value: The label value.
+    :return: The escaped label value.
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = MetricsRegistry()
+
+CYCLE_DURATION = REGISTRY.histogram('newsbot_cycle_seconds', 'Duration of a collection cycle')
+FEED_FETCH_DURATION = REGISTRY.histogram('newsbot_feed_fetch_seconds', 'Duration of a feed fetch, parse included',
+                                         ['feed'])
+FEED_PARSE_DURATION = REGISTRY.histogram('newsbot_feed_parse_seconds', 'Duration of a feed page parse', ['feed'])
+FEED_ERRORS = REGISTRY.counter('newsbot_feed_errors_total', 'Failed feed fetches', ['feed', 'reason'])
+ITEM_CACHE = REGISTRY.counter('newsbot_item_cache_total', 'Item cache lookups', ['result'])
+DUPLICATE_ITEMS = REGISTRY.counter('newsbot_duplicate_items_total', 'Items skipped as cross-feed duplicates')
+QUEUED_ITEMS = REGISTRY.counter('newsbot_queued_items_total', 'Items queued for posting', ['feed'])
+ICON_RESOLVE_DURATION = REGISTRY.histogram('newsbot_icon_resolve_seconds', 'Duration of a batch icon resolve')
+ICON_CACHE = REGISTRY.counter('newsbot_icon_cache_total', 'Icon cache lookups', ['result'])
+EMBED_BUILD_DURATION = REGISTRY.histogram('newsbot_embed_build_seconds', 'Duration of a batch embed build',
+                                          buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+SEND_DURATION = REGISTRY.histogram('newsbot_send_seconds', 'Duration of a message send, retries included',
+                                   ['transport'])
+SEND_ERRORS = REGISTRY.counter('newsbot_send_errors_total', 'Failed message sends', ['transport'])
+REACTION_DURATION = REGISTRY.histogram('newsbot_reaction_seconds', 'Duration of a reaction, retries included')
+RATE_LIMITED = REGISTRY.counter('newsbot_rate_limited_total', 'Requests answered with a 429', ['scope'])
@@ -0,0 +1,228 @@
+import collections
+import hashlib
+import math
+import re
+import time
+from news.item import NewsItem
+from typing import Deque, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+TRACKING_PARAMS = frozenset(['fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid', 'ref', 'ref_src',
+                             'yclid', '_ga', '_hsenc', '_hsmi'])
+TRACKING_PREFIXES = ('utm_', 'pk_', 'mtm_')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+_WORDS = re.compile(r'\W+')
+_NUMBERS = re.compile(r'\d+(?:\.\d+)*')
+# Spreads the bits of a byte into 16 bit lanes, so the set bits of every shingle are counted with big int additions.
+_LANE_BITS = 16
+_SPREAD = [sum(1 << (_LANE_BITS * bit) for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL so its tracking variants compare equal: the scheme and host are lowercased, the www. prefix,
+    default port, fragment, trailing slash and tracking parameters are dropped and the query is sorted.
+    :param url: The URL to normalize.
+    :return: The normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or 'http'
+    host = (parts.hostname or '').rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES))
+    return urlunsplit(('https' if scheme == 'http' else scheme, host, parts.path.rstrip('/') or '/',
+                       urlencode(query), ''))
+
+
+def simhash(text: str) -> int:
+    """
+    Fingerprints a text with a 64 bit SimHash over its character trigrams, near duplicate texts get fingerprints
+    within a small hamming distance.
+    :param text: The text to fingerprint.
+    :return: The fingerprint, or 0 for an empty text.
+    """
+    text = _WORDS.sub(' ', text.lower()).strip()
+    if not text:
+        return 0
+
+    shingles = {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+    counts = 0
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+        for index, byte in enumerate(reversed(digest)):
+            counts += _SPREAD[byte] << (_LANE_BITS * 8 * index)
+
+    mask = (1 << _LANE_BITS) - 1
+    return sum(1 << bit for bit in range(64) if 2 * (counts >> (_LANE_BITS * bit) & mask) > len(shingles))
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.count = 0
+        self._size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hash_count = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def add(self, key: str):
+        """
+        Adds a key to the filter.
+        :param key: The key.
+        """
+        for index in self._indexes(key):
+            self._bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[index >> 3] & 1 << (index & 7) for index in self._indexes(key))
+
+    def _indexes(self, key: str) -> List[int]:
+        """
+        Gets the bit indexes of a key, derived from two halves of a single digest.
+        :param key: The key.
+        :return: The bit indexes.
+        """
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self._size for i in range(self._hash_count)]
+
+
+class RotatingBloomFilter:
+    def __init__(self, window: float, capacity: int, error_rate: float):
+        self._period = window / 2
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._rotated_at = time.monotonic()
+
+    def add(self, key: str):
+        """
+        Adds a key to the current generation, rotating the generations once it expired or filled up.
+        :param key: The key.
+        """
+        if time.monotonic() - self._rotated_at >= self._period or self._current.count >= self._capacity:
+            self._previous, self._current = self._current, BloomFilter(self._capacity, self._error_rate)
+            self._rotated_at = time.monotonic()
+        self._current.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._current or key in self._previous
+
+
+class Deduplicator:
+    BANDS = 4
+    BAND_BITS = 64 // BANDS
+
+    def __init__(self, window: float = 172800.0, capacity: int = 100000, error_rate: float = 0.001,
+                 max_distance: int = 3):
+        if not 0 <= max_distance < self.BANDS:
+            raise ValueError(f'max_distance must be between 0 and {self.BANDS - 1}, got {max_distance}')
+
+        self._window = window
+        self._capacity = capacity
+        self._max_distance = max_distance
+        self._urls = RotatingBloomFilter(window, capacity, error_rate)
+        self._fingerprints: Deque[Tuple[float, int, str]] = collections.deque()
+        self._bands: Dict[Tuple[int, int, str], List[int]] = {}
+
+    def is_duplicate(self, item: NewsItem) -> bool:
+        """
+        Checks whether an item was already seen within the window, under another URL variant or a near duplicate
+        title, and remembers it otherwise.
+        A near duplicate title only counts for an item of the same website with the same numbers in its title, so
+        e.g. the release notes of two versions are both posted.
+        :param item: The news item.
+        :return: True if the item is a duplicate, False otherwise.
+        """
+        self._expire()
+        url = normalize_url(item.url)
+        if url in self._urls:
+            return True
+
+        fingerprint = simhash(item.title or '')
+        context = self._get_context(url, item.title or '')
+        if fingerprint and self._is_near_duplicate(fingerprint, context):
+            return True
+
+        self._urls.add(url)
+        if fingerprint:
+            self._add_fingerprint(fingerprint, context)
+        return False
+
+    def _is_near_duplicate(self, fingerprint: int, context: str) -> bool:
+        """
+        Checks whether a fingerprint is within the hamming distance of a remembered one of the same context, a
+        fingerprint this close shares at least one band with it so only the fingerprints of its bands are compared.
+        :param fingerprint: The title fingerprint.
+        :param context: The context of the title, see _get_context.
+        :return: True if a near duplicate is remembered, False otherwise.
+        """
+        for band in self._get_bands(fingerprint, context):
+            for other in self._bands.get(band, ()):
+                if bin(fingerprint ^ other).count('1') <= self._max_distance:
+                    return True
+        return False
+
+    def _add_fingerprint(self, fingerprint: int, context: str):
+        """
+        Remembers a fingerprint, evicting the oldest one if the window is full.
+        :param fingerprint: The title fingerprint.
+        :param context: The context of the title.
+        """
+        if len(self._fingerprints) >= self._capacity:
+            self._remove_fingerprint(*self._fingerprints.popleft()[1:])
+
+        self._fingerprints.append((time.monotonic(), fingerprint, context))
+        for band in self._get_bands(fingerprint, context):
+            self._bands.setdefault(band, []).append(fingerprint)
+
+    def _remove_fingerprint(self, fingerprint: int, context: str):
+        """
+        Forgets a fingerprint.
+        :param fingerprint: The title fingerprint.
+        :param context: The context of the title.
+        """
+        for band in self._get_bands(fingerprint, context):
+            fingerprints = self._bands[band]
+            fingerprints.remove(fingerprint)
+            if not fingerprints:
+                del self._bands[band]
+
+    def _expire(self):
+        """
+        Forgets the fingerprints that outlived the window.
+        """
+        expired_at = time.monotonic() - self._window
+        while self._fingerprints and self._fingerprints[0][0] < expired_at:
+            self._remove_fingerprint(*self._fingerprints.popleft()[1:])
+
+    def _get_bands(self, fingerprint: int, context: str) -> List[Tuple[int, int, str]]:
+        """
+        Splits a fingerprint into its bands, the bands of different contexts never match.
+        :param fingerprint: The title fingerprint.
+        :param context: The context of the title.
+        :return: The index, value and context of each band.
+        """
+        mask = (1 << self.BAND_BITS) - 1
+        return [(band, fingerprint >> (band * self.BAND_BITS) & mask, context) for band in range(self.BANDS)]
+
+    @staticmethod
+    def _get_context(url: str, title: str) -> str:
+        """
+        Gets the context a near duplicate title has to share, the host of the item and the numbers of its title.
+        :param url: The normalized item URL.
+        :param title: The item title.
+        :return: The context.
+        """
+        return ' '.join([urlsplit(url).netloc] + _NUMBERS.findall(title))
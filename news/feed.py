@@ -1,18 +1,25 @@
+import datetime
 from abc import abstractmethod
+from news.fetcher import FeedFetcher
 from news.item import NewsItem
-from typing import List
+from typing import List, Optional
 
 
 class NewsFeed:
+    def __init__(self, name: str):
+        self.name = name
+
     @abstractmethod
-    def get(self, ua: str, timestamp: float, *args, **kwargs) -> List[NewsItem]:
+    async def fetch(self, fetcher: FeedFetcher, ua: str, min_date: datetime.date, *args, **kwargs) \
+            -> Optional[List[NewsItem]]:
         """
-        Gets the news items from the feed.
+        Fetches the news items from the feed.
+        :param fetcher: The shared fetcher to retrieve the feed pages with.
         :param ua: The user agent to be used in the request.
-        :param timestamp: The timestamp for the oldest item acceptable.
-        :return: A list of news items.
+        :param min_date: The minimum date accepted.
+        :return: A list of news items, or None if the feed could not be retrieved.
         """
         raise NotImplementedError
 
     def __repr__(self):
-        return ""
+        return self.name
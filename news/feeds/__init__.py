@@ -1 +1,2 @@
 from news.feeds.code_project import CodeProject
+from news.feeds.rss import RssFeed
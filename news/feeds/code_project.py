@@ -1,29 +1,85 @@
-import requests
+import asyncio
 import datetime
-from lxml import html
+import functools
+from lxml import etree, html
+from metrics import FEED_PARSE_DURATION
 from news.item import NewsItem
 from news.feed import NewsFeed
+from news.fetcher import FeedFetcher
 from typing import List, Optional
 
 
 class CodeProject(NewsFeed):
-    def get(self, ua: str, min_date: datetime.date, raw: bytes = None, url: bytes = None, *args, **kwargs) \
-            -> Optional[List[NewsItem]]:
+    URL = 'https://www.codeproject.com/script/News/List.aspx'
+
+    # Compiled once, instead of re-parsing the expressions for every row of every page.
+    _ROWS = etree.XPath('//table[@class="feature news"]//tr')
+    _TITLE = etree.XPath('.//td//div[@class="hover-container"]//a[@class="NewsHL"]')
+    _SUBTITLE = etree.XPath('.//td//div[@class="hover-container"]//div[@class="NewsBL"]')
+    _METADATA = etree.XPath('.//td[@class="small-text"]')
+    _URL = etree.XPath('.//td[@class="small-text"]//a')
+
+    def __init__(self, name: str = "CodeProject", url: str = URL, max_pages: int = 10, max_in_flight: int = 4):
+        super().__init__(name)
+        self.url = url
+        self.max_pages = max_pages
+        self.max_in_flight = max_in_flight
+
+    async def fetch(self, fetcher: FeedFetcher, ua: str, min_date: datetime.date, raw: bytes = None,
+                    url: str = None, *args, **kwargs) -> Optional[List[NewsItem]]:
         """
-        Gets the news items from the feed.
+        Fetches the news items from the feed.
+        :param fetcher: The shared fetcher to retrieve the feed pages with.
         :param ua: The user agent to be used in the request.
         :param min_date: The minimum date accepted.
         :param raw: A raw bytes string to parse.
-        :param url: The URL to retrieve the HTML content from.
+        :param url: The URL of the first page to retrieve the HTML content from.
         :return: A list of news items.
         """
         if raw:
-            return self._pick(self._parse(raw), min_date)
+            with FEED_PARSE_DURATION.time(feed=self.name):
+                return self._pick(self._parse(raw), min_date)
+
+        # The first page is enough while the feed is polled regularly. The next pages are only walked while they may
+        # still hold items since the minimum date, a few at a time, to catch up after a downtime without crawling the
+        # site serially.
+        items = {}
+        page, wave_size = 1, 1
+        while page <= self.max_pages:
+            pages = range(page, min(page + wave_size, self.max_pages + 1))
+            results = await asyncio.gather(*[self._fetch_page(fetcher, ua, url or self.url, number)
+                                             for number in pages])
+            for page_items in results:
+                if not page_items:
+                    return self._pick(list(items.values()), min_date)
+
+                for item in page_items:
+                    items.setdefault(item.url, item)
+                if min(self._parse_date(item.date) for item in page_items) < min_date:
+                    return self._pick(list(items.values()), min_date)
+
+            page, wave_size = page + wave_size, self.max_in_flight
+
+        return self._pick(list(items.values()), min_date)
+
+    async def _fetch_page(self, fetcher: FeedFetcher, ua: str, url: str, page: int) -> Optional[List[NewsItem]]:
+        """
+        Fetches a single page of the news list.
+        :param fetcher: The shared fetcher to retrieve the feed pages with.
+        :param ua: The user agent to be used in the request.
+        :param url: The URL of the first page.
+        :param page: The page number, starting at 1.
+        :return: The news items of the page, or None if the page did not change.
+        """
+        if page > 1:
+            url = f'{url}{"&" if "?" in url else "?"}pgnum={page}'
 
-        url = url or 'https://www.codeproject.com/script/News/List.aspx'
-        result = requests.get(url, headers={'User-Agent': ua})
-        if result and result.status_code == 200:
-            return self._pick(self._parse(result.content), min_date)
+        content = await fetcher.get(url, ua)
+        if content is None:
+            return None
+
+        with FEED_PARSE_DURATION.time(feed=self.name):
+            return self._parse(content)
 
     @staticmethod
     def _pick(items: List[NewsItem], min_date: datetime.date) -> List[NewsItem]:
@@ -33,12 +89,17 @@ class CodeProject(NewsFeed):
         :param min_date: The minimum date accepted.
         :return: The picked list of news items.
         """
-        picked_items = []
-        for item in items:
-            item_date = datetime.datetime.strptime(item.date, "%d %b %Y").date()
-            if item_date >= min_date:
-                picked_items.append(item)
-        return picked_items
+        return [item for item in items if CodeProject._parse_date(item.date) >= min_date]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _parse_date(date: str) -> datetime.date:
+        """
+        Parses the date of a news item, a page holds only a handful of distinct dates.
+        :param date: The date as displayed on the site.
+        :return: The parsed date.
+        """
+        return datetime.datetime.strptime(date, "%d %b %Y").date()
 
     @staticmethod
     def _parse(content: bytes) -> List[NewsItem]:
@@ -48,25 +109,21 @@ class CodeProject(NewsFeed):
         :return: A list of news items.
         """
         nodes = html.fromstring(content)
-        node_items = nodes.xpath('//table[@class="feature news"]//tr')[1:]
+        node_items = CodeProject._ROWS(nodes)[1:]
         items = []
         for item in node_items:
-            title = item.xpath('.//td//div[@class="hover-container"]//a[@class="NewsHL"]')
-            subtitle = item.xpath('.//td//div[@class="hover-container"]//div[@class="NewsBL"]')
-            metadata = item.xpath('.//td[@class="small-text"]')
-            url = item.xpath('.//td[@class="small-text"]//a')
-
-            if not title or not subtitle or len(metadata) != 4 or not url:
+            # The cheapest filters go first, so skipped rows never run the remaining queries.
+            metadata = CodeProject._METADATA(item)
+            if len(metadata) != 4 or metadata[0].text == 'Hot Threads':
                 continue
 
-            item_type, date, clicks = [metadata[0].text, metadata[2].text, metadata[3].text]
-
-            if item_type == 'Hot Threads':
+            title = CodeProject._TITLE(item)
+            subtitle = CodeProject._SUBTITLE(item)
+            url = CodeProject._URL(item)
+            if not title or not subtitle or not url:
                 continue
 
+            item_type, date, clicks = [metadata[0].text, metadata[2].text, metadata[3].text]
             items.append(NewsItem(title[0].text, subtitle[0].text.strip(), url[0].get('href'), url[0].text, item_type,
                                   date))
         return items
-
-    def __repr__(self):
-        return "CodeProject"
@@ -0,0 +1,160 @@
+import datetime
+import email.utils
+import time
+from lxml import etree, html
+from metrics import FEED_PARSE_DURATION
+from news.item import NewsItem
+from news.feed import NewsFeed
+from news.fetcher import FeedFetcher
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+RDF = '{http://purl.org/rss/1.0/}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+CONTENT = '{http://purl.org/rss/1.0/modules/content/}'
+
+
+class RssFeed(NewsFeed):
+    ITEM_TAGS = ('item', f'{ATOM}entry', f'{RDF}item')
+    CHUNK_SIZE = 16384
+
+    def __init__(self, name: str, url: str, item_type: str = 'News', max_subtitle_length: int = 300):
+        super().__init__(name)
+        self.url = url
+        self.item_type = item_type
+        self.max_subtitle_length = max_subtitle_length
+
+    async def fetch(self, fetcher: FeedFetcher, ua: str, min_date: datetime.date, raw: bytes = None,
+                    *args, **kwargs) -> Optional[List[NewsItem]]:
+        """
+        Fetches the news items from the feed, reading it incrementally until an item older than the minimum date.
+        :param fetcher: The shared fetcher to retrieve the feed pages with.
+        :param ua: The user agent to be used in the request.
+        :param min_date: The minimum date accepted.
+        :param raw: A raw bytes string to parse.
+        :return: A list of news items.
+        """
+        parser = etree.XMLPullParser(events=('end',), tag=self.ITEM_TAGS, recover=True, resolve_entities=False)
+        items = []
+        if raw:
+            with FEED_PARSE_DURATION.time(feed=self.name):
+                parser.feed(raw)
+                self._read_events(parser, min_date, items)
+            return items
+
+        # The parse is interleaved with the download, only the time spent parsing is observed.
+        parse_duration = 0.0
+        async with fetcher.stream(self.url, ua) as response:
+            if response is None:
+                return []
+
+            async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                started_at = time.perf_counter()
+                parser.feed(chunk)
+                is_reading = self._read_events(parser, min_date, items)
+                parse_duration += time.perf_counter() - started_at
+                if not is_reading:
+                    break
+
+        FEED_PARSE_DURATION.observe(parse_duration, feed=self.name)
+        return items
+
+    def _read_events(self, parser: etree.XMLPullParser, min_date: datetime.date, items: List[NewsItem]) -> bool:
+        """
+        Reads the items parsed so far, dropping their elements so the parsed tree never holds the whole feed.
+        :param parser: The feed parser.
+        :param min_date: The minimum date accepted.
+        :param items: The items read so far, the new items are appended to it.
+        :return: True if the feed should be read further, False once an item is older than the minimum date.
+        """
+        for _, element in parser.read_events():
+            item, date = self._parse_item(element)
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+            if date and date < min_date:
+                return False
+            if item:
+                items.append(item)
+        return True
+
+    def _parse_item(self, element: etree.ElementBase) -> Tuple[Optional[NewsItem], Optional[datetime.date]]:
+        """
+        Parses an RSS item or an Atom entry.
+        :param element: The item element.
+        :return: The news item, or None if it has no title or link, and its date if it has one.
+        """
+        title = self._find_text(element, 'title', f'{ATOM}title', f'{RDF}title')
+        url = self._find_text(element, 'link', f'{RDF}link') or self._find_atom_link(element)
+        subtitle = self._find_text(element, 'description', f'{ATOM}summary', f'{RDF}description',
+                                   f'{CONTENT}encoded', f'{ATOM}content') or ''
+        date = self._parse_date(self._find_text(element, 'pubDate', f'{ATOM}published', f'{ATOM}updated',
+                                                f'{DC}date'))
+        if not title or not url:
+            return None, date
+
+        return NewsItem(title, self._to_subtitle(subtitle), url, urlparse(url).netloc, self.item_type,
+                        date.strftime('%d %b %Y') if date else ''), date
+
+    def _to_subtitle(self, text: str) -> str:
+        """
+        Converts the item description into a subtitle, without its markup and bounded in length.
+        :param text: The item description, which may hold HTML.
+        :return: The subtitle.
+        """
+        if '<' in text:
+            try:
+                text = html.fromstring(text).text_content()
+            except etree.ParserError:
+                pass
+        text = ' '.join(text.split())
+        if len(text) > self.max_subtitle_length:
+            text = text[:self.max_subtitle_length - 1].rstrip() + '…'
+        return text
+
+    @staticmethod
+    def _find_text(element: etree.ElementBase, *tags: str) -> Optional[str]:
+        """
+        Finds the text of the first child with one of the tags.
+        :param element: The item element.
+        :param tags: The candidate tags, by preference.
+        :return: The stripped text, or None if no child has any.
+        """
+        for tag in tags:
+            text = element.findtext(tag)
+            if text and text.strip():
+                return text.strip()
+        return None
+
+    @staticmethod
+    def _find_atom_link(element: etree.ElementBase) -> Optional[str]:
+        """
+        Finds the alternate link of an Atom entry.
+        :param element: The entry element.
+        :return: The link, or None if the entry has none.
+        """
+        return next((link.get('href') for link in element.iterfind(f'{ATOM}link')
+                     if link.get('rel', 'alternate') == 'alternate' and link.get('href')), None)
+
+    @staticmethod
+    def _parse_date(date: Optional[str]) -> Optional[datetime.date]:
+        """
+        Parses an RFC 822 (RSS) or an ISO 8601 (Atom) date.
+        :param date: The date text.
+        :return: The parsed date, or None if it's missing or malformed.
+        """
+        if not date:
+            return None
+
+        try:
+            return email.utils.parsedate_to_datetime(date).date()
+        except (TypeError, ValueError, IndexError):
+            pass
+
+        try:
+            return datetime.date.fromisoformat(date[:10])
+        except ValueError:
+            return None
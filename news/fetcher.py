@@ -0,0 +1,107 @@
+import contextlib
+import hashlib
+from aiohttp import ClientResponse, ClientSession
+from logger import Logger
+from state_store import StateStore
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+
+class FeedFetcher:
+    def __init__(self, session: ClientSession, store: StateStore,
+                 validators: Dict[str, Tuple[Optional[str], Optional[str], str]] = None):
+        self._session = session
+        self._store = store
+        self._validators = validators
+        self._logger = Logger.get_logger()
+
+    def defer_validators(self) -> 'FeedFetcher':
+        """
+        Creates a fetcher for a single poll of a feed, the validators of the pages it retrieves are only saved by
+        save_validators, once the items of the pages are journaled.
+        :return: The fetcher, sharing the HTTP session.
+        """
+        return FeedFetcher(self._session, self._store, {})
+
+    def save_validators(self):
+        """
+        Saves the deferred validators of the retrieved pages, the next retrieval of an unchanged page is skipped.
+        """
+        for url, (etag, last_modified, digest) in self._validators.items():
+            self._store.set_validators(url, etag, last_modified, digest)
+        self._validators.clear()
+
+    async def get(self, url: str, ua: str) -> Optional[bytes]:
+        """
+        Gets a feed page, conditionally on it having changed since the last time it was retrieved.
+        :param url: The URL of the feed page.
+        :param ua: The user agent to be used in the request.
+        :return: The page content, or None if the page did not change.
+        """
+        etag, last_modified, digest = self._store.get_validators(url) or (None, None, None)
+        async with self._session.get(url, headers=self._get_headers(ua, etag, last_modified)) as response:
+            if response.status == 304:
+                self._logger.debug("Feed page not modified", url=url)
+                return None
+
+            response.raise_for_status()
+            content = await response.read()
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+        content_digest = hashlib.sha256(content).hexdigest()
+        self._set_validators(url, etag, last_modified, content_digest)
+        if content_digest == digest:
+            self._logger.debug("Feed page unchanged", url=url)
+            return None
+
+        return content
+
+    @contextlib.asynccontextmanager
+    async def stream(self, url: str, ua: str) -> AsyncIterator[Optional[ClientResponse]]:
+        """
+        Opens a feed page for reading its content incrementally, conditionally on it having changed since the last time
+        it was retrieved. The content is not digested since it may not be read completely, its digest is left empty.
+        :param url: The URL of the feed page.
+        :param ua: The user agent to be used in the request.
+        :return: The open response, or None if the page did not change.
+        """
+        etag, last_modified, _ = self._store.get_validators(url) or (None, None, None)
+        async with self._session.get(url, headers=self._get_headers(ua, etag, last_modified)) as response:
+            if response.status == 304:
+                self._logger.debug("Feed page not modified", url=url)
+                yield None
+                return
+
+            response.raise_for_status()
+            yield response
+
+            # Only remembered once the page was handled, so a failed read is retried in full.
+            self._set_validators(url, response.headers.get('ETag'), response.headers.get('Last-Modified'), '')
+
+    def _set_validators(self, url: str, etag: Optional[str], last_modified: Optional[str], digest: str):
+        """
+        Sets the validators of a retrieved page, deferred until save_validators if the fetcher defers them.
+        :param url: The URL of the feed page.
+        :param etag: The ETag header of the retrieval.
+        :param last_modified: The Last-Modified header of the retrieval.
+        :param digest: The digest of the page content.
+        """
+        if self._validators is None:
+            self._store.set_validators(url, etag, last_modified, digest)
+        else:
+            self._validators[url] = (etag, last_modified, digest)
+
+    @staticmethod
+    def _get_headers(ua: str, etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+        """
+        Gets the request headers of a feed page, conditional on the validators of its last retrieval.
+        :param ua: The user agent to be used in the request.
+        :param etag: The ETag header of the last retrieval.
+        :param last_modified: The Last-Modified header of the last retrieval.
+        :return: The request headers.
+        """
+        headers = {'User-Agent': ua}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
@@ -1,9 +1,10 @@
 from discord import Embed
 from urllib.parse import urlparse
-from icon_manager import IconManager
 
 
 class NewsItem:
+    __slots__ = ('title', 'subtitle', 'url', 'source', 'item_type', 'date')
+
     def __init__(self, title: str, subtitle: str, url: str, source: str, item_type: str, date: str):
         self.title = title
         self.subtitle = subtitle
@@ -12,18 +13,24 @@ class NewsItem:
         self.item_type = item_type
         self.date = date
 
-    def to_embed(self, color: int, icon_mgr: IconManager = None, footer: str = None) -> Embed:
+    @property
+    def origin(self) -> str:
+        """
+        Gets the website origin of the news item, e.g. https://www.codeproject.com.
+        :return: The website origin.
+        """
+        return '{uri.scheme}://{uri.netloc}'.format(uri=urlparse(self.url))
+
+    def to_embed(self, color: int, icon_url: str = None, footer: str = None) -> Embed:
         """
         Converts the news item into a discord embed.
         :param color: The color of the embed line.
-        :param icon_mgr: The icon manager, for caching purposes.
+        :param icon_url: The resolved icon url of the website, defaults to its favicon.
         :param footer: The footer text of the embed.
         :return: The embed object for posting.
         """
-        ico = '{uri.scheme}://{uri.netloc}'.format(uri=urlparse(self.url))
-        ico = (icon_mgr.get(ico) if icon_mgr else None) or f'{ico}/favicon.ico'
         embed = Embed(title=self.title, description=self.subtitle, color=color)
-        embed.set_author(name=self.source, icon_url=ico)
+        embed.set_author(name=self.source, icon_url=icon_url or f'{self.origin}/favicon.ico')
         embed.add_field(name=self.url, value=self.item_type)
         if footer:
             embed.set_footer(text=footer)
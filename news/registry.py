@@ -0,0 +1,94 @@
+import importlib
+from logger import Logger
+from news.feed import NewsFeed
+from news.feeds import CodeProject, RssFeed
+from typing import Dict, Optional, Type
+
+try:
+    from importlib.metadata import entry_points
+except ImportError:
+    entry_points = None
+
+
+class FeedRegistry:
+    ENTRY_POINT_GROUP = 'discordnews.feeds'
+
+    def __init__(self):
+        self._types: Dict[str, Type[NewsFeed]] = {'CodeProject': CodeProject, 'RSS': RssFeed, 'Atom': RssFeed}
+        self._entry_points = None
+        self._logger = Logger.get_logger()
+
+    def register(self, type_name: str, feed_type: Type[NewsFeed]):
+        """
+        Registers a feed type.
+        :param type_name: The name the feed type is referred to by in the configuration.
+        :param feed_type: The feed class.
+        """
+        self._types[type_name] = feed_type
+
+    def get(self, type_name: str) -> Optional[Type[NewsFeed]]:
+        """
+        Gets a feed type, by its registered name, its entry point in the discordnews.feeds group, or its import path
+        in the module:class form.
+        :param type_name: The feed type name.
+        :return: The feed class, or None if not found.
+        """
+        if type_name not in self._types:
+            feed_type = self._load_entry_point(type_name) or self._load_import_path(type_name)
+            if feed_type:
+                self._types[type_name] = feed_type
+
+        return self._types.get(type_name)
+
+    def create(self, name: str, feed_config: dict) -> Optional[NewsFeed]:
+        """
+        Creates a feed out of its configuration.
+        :param name: The feed name.
+        :param feed_config: The feed options, the type defaults to the feed name.
+        :return: The feed, or None if its type is unknown or its options are invalid.
+        """
+        options = dict(feed_config)
+        type_name = options.pop('type', name)
+        feed_type = self.get(type_name)
+        if not feed_type:
+            self._logger.error("Unknown feed type", feed=name, type=type_name)
+            return None
+
+        try:
+            return feed_type(name=name, **options)
+        except TypeError as e:
+            self._logger.error("Invalid feed options", feed=name, type=type_name, ex=e)
+            return None
+
+    def _load_entry_point(self, type_name: str) -> Optional[Type[NewsFeed]]:
+        """
+        Loads a feed type from the entry points of the installed packages.
+        :param type_name: The entry point name.
+        :return: The feed class, or None if not found.
+        """
+        if self._entry_points is None:
+            self._entry_points = {}
+            if entry_points:
+                found = entry_points()
+                found = found.select(group=self.ENTRY_POINT_GROUP) if hasattr(found, 'select') else \
+                    found.get(self.ENTRY_POINT_GROUP, [])
+                self._entry_points = {entry_point.name: entry_point for entry_point in found}
+
+        entry_point = self._entry_points.get(type_name)
+        return entry_point.load() if entry_point else None
+
+    def _load_import_path(self, type_name: str) -> Optional[Type[NewsFeed]]:
+        """
+        Loads a feed type by its import path.
+        :param type_name: The import path, in the module:class form.
+        :return: The feed class, or None if not found.
+        """
+        module_name, _, class_name = type_name.partition(':')
+        if not class_name:
+            return None
+
+        try:
+            return getattr(importlib.import_module(module_name), class_name)
+        except (ImportError, AttributeError) as e:
+            self._logger.error("Unable to import feed type", type=type_name, ex=e)
+            return None
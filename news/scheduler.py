@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import time
+from news.feed import NewsFeed
+from typing import Dict, List, Optional
+
+
+class FeedSchedule:
+    def __init__(self, feed: NewsFeed, min_delay: float, max_delay: float):
+        self.feed = feed
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+        self.due = time.monotonic()
+
+    def adapt(self, new_item_count: Optional[int]):
+        """
+        Adapts the polling delay to the last poll, polling faster while new items keep appearing.
+        :param new_item_count: The amount of new items of the last poll, or None if it failed.
+        """
+        if new_item_count:
+            self.delay = max(self.min_delay, self.delay / 2)
+        else:
+            self.delay = min(self.max_delay, self.delay * 2)
+
+        self.due = time.monotonic() + self.delay
+
+    def set_delays(self, min_delay: float, max_delay: float):
+        """
+        Changes the delay bounds, the next poll is brought forward if it's further away than the new maximum delay.
+        :param min_delay: The minimum delay(in seconds) between polls.
+        :param max_delay: The maximum delay(in seconds) between polls.
+        """
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min(max(self.delay, min_delay), max_delay)
+        self.due = min(self.due, time.monotonic() + self.delay)
+
+    def __repr__(self):
+        return f'FeedSchedule(feed={self.feed}, delay={self.delay})'
+
+
+class FeedScheduler:
+    def __init__(self, idle_delay: float = 60.0):
+        self._idle_delay = idle_delay
+        self._heap = []
+        self._counter = itertools.count()
+        self._schedules: Dict[str, FeedSchedule] = {}
+
+    def add(self, schedule: FeedSchedule):
+        """
+        Adds a feed to the schedule.
+        :param schedule: The schedule of the feed.
+        """
+        self._schedules[repr(schedule.feed)] = schedule
+        heapq.heappush(self._heap, (schedule.due, next(self._counter), schedule))
+
+    def time_until_due(self) -> float:
+        """
+        Gets the time until the next feed is due, the idle delay while no feed is scheduled so the feeds are checked
+        again once they change.
+        :return: The time(in seconds) until the next feed is due.
+        """
+        if not self._heap:
+            return self._idle_delay
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def pop_due(self) -> List[FeedSchedule]:
+        """
+        Pops all the feeds that are due.
+        :return: The schedules of the due feeds.
+        """
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def reschedule(self, schedule: FeedSchedule, new_item_count: Optional[int]):
+        """
+        Schedules the next poll of a feed according to its last poll.
+        :param schedule: The schedule of the polled feed.
+        :param new_item_count: The amount of new items of the last poll, or None if it failed.
+        """
+        schedule.adapt(new_item_count)
+        self.add(schedule)
+
+    def set_delays(self, name: str, min_delay: float, max_delay: float):
+        """
+        Changes the delay bounds of a feed.
+        :param name: The feed name.
+        :param min_delay: The minimum delay(in seconds) between polls.
+        :param max_delay: The maximum delay(in seconds) between polls.
+        """
+        schedule = self._schedules.get(name)
+        if not schedule:
+            return
+
+        schedule.set_delays(min_delay, max_delay)
+        self._heap = [(entry_schedule.due, counter, entry_schedule) for _, counter, entry_schedule in self._heap]
+        heapq.heapify(self._heap)
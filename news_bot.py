@@ -4,34 +4,61 @@ import signal
 import sys
 import asyncio
 import datetime
-import time
 import random
 import re
+import time
+import aiohttp
 from bot import Bot as DiscordBot
+from config_watcher import ConfigWatcher
 from icon_manager import IconManager
 from logger import Logger
-from imgurpython import ImgurClient
-from imgurpython.helpers.error import ImgurClientError
-from typing import Optional
-from yaml.parser import ParserError
-from news.feeds import CodeProject
+from metrics import CYCLE_DURATION, DUPLICATE_ITEMS, EMBED_BUILD_DURATION, FEED_ERRORS, FEED_FETCH_DURATION, \
+    ICON_RESOLVE_DURATION, ITEM_CACHE, QUEUED_ITEMS, REGISTRY, MetricsServer
+from outbox import Outbox, create_outbox_item
+from profiler import CycleProfiler
+from shards import ShardedBot
+from startup import PROFILER
+from state_store import StateStore
+from typing import List, Optional, Tuple
+from news.dedup import Deduplicator
+from news.feed import NewsFeed
+from news.fetcher import FeedFetcher
+from news.item import NewsItem
+from news.registry import FeedRegistry
+from news.scheduler import FeedSchedule, FeedScheduler
 from yaml.reader import Reader
 
 
 class NewsBot:
+    SCHEDULE_KEYS = ('min_delay', 'max_delay')
+
     def __init__(self, args):
         self._args = args
         self._config = self._load_yaml(self._args.config)
-        self._imgur_client = self._get_imgur_client(self._args.imgur)
-        self._icon_manager = IconManager(self._imgur_client, self._load_yaml(self._args.icons),
-                                         self._config["user_agent"])
+        Logger.configure(**self._config.get("logging", {}))
+        self._store = StateStore(self._args.state, self._config.get("item_ttl", 172800.0))
+        self._deduplicator = Deduplicator(**{"window": self._config.get("item_ttl", 172800.0),
+                                             **self._config.get("dedup", {})})
+        self._store.import_legacy(self._config.get("cache"),
+                                  self._load_yaml(self._args.icons) if self._args.icons else None)
+        self._icon_manager = IconManager(self._args.imgur, self._store, self._config["user_agent"],
+                                         **self._config.get("icon_cache", {}))
         self._logger = Logger.get_logger()
         self._is_active = True
-        self._feeds = [CodeProject()]
+        self._rescheduled = asyncio.Event()
+        self._feeds = self._create_feeds()
+        self._scheduler = self._create_scheduler()
+        self._session = None
+        self._fetcher = None
+        self._collect_task = None
         self._loop = asyncio.get_event_loop()
+        self._outbox = Outbox(self._store)
+        self._bot = self._create_bot()
+        self._metrics_server = self._create_metrics_server()
+        self._profiler = CycleProfiler(self._args.profile or 0, self._args.profile_dir)
 
     def __del__(self):
-        self.save()
+        self.close()
 
     def run(self):
         """
@@ -39,102 +66,290 @@ class NewsBot:
         """
         self._logger.info('NewsBot start')
         self._loop.create_task(self._handle_graceful_terminate())
-        self._loop.run_until_complete(self.collect_news())
+        self._loop.create_task(self._bot.serve())
+        reload_interval = self._config.get("config_reload_interval", 5.0)
+        if reload_interval:
+            watcher = ConfigWatcher(self._args.config, self._load_yaml, reload_interval)
+            self._loop.create_task(watcher.watch(self._apply_config))
+        if self._metrics_server:
+            self._loop.run_until_complete(self._metrics_server.start())
+        self._collect_task = self._loop.create_task(self.collect_news())
+        try:
+            self._loop.run_until_complete(self._collect_task)
+        except asyncio.CancelledError:
+            self._logger.info('NewsBot stopping')
+        self._loop.run_until_complete(self._bot.stop())
+        if self._metrics_server:
+            self._loop.run_until_complete(self._metrics_server.stop())
+        self.close()
 
     def on_signal(self, sig_id: int, frame):
         """
-        Catches system signals.
+        Catches system signals, the collection is stopped and the queued batches are posted before exiting. A second
+        signal exits right away, the batches that are not posted yet are recovered on the next start.
         :param sig_id: The signal unique id that was caught.
         :param frame: The frame of the signal.
         """
         if sig_id != signal.SIGINT:
             return
 
+        if not self._is_active or not self._collect_task:
+            self.close()
+            sys.exit(0)
+
         self._is_active = False
-        self.save()
-        sys.exit(0)
+        # Wakes the loop up, the handler runs in between its callbacks.
+        self._loop.call_soon_threadsafe(self._collect_task.cancel)
 
-    def save(self):
+    def close(self):
         """
-        Saves the bot configuration.
+        Closes the bot state, every change is already persisted as it happens.
         """
-        self._icon_manager.save(self._args.icons)
-        with open(self._args.config, 'w+') as config_file:
-            yaml.dump(self._config, config_file)
+        self._store.close()
 
     async def collect_news(self):
         """
-        Actively collects the news at a preconfigured period from the available news feeds.
+        Actively collects the news from the available news feeds, each polled whenever it is due.
         """
-        while self._is_active:
-            self._logger.info("Collecting news")
-            self._invalidate_cache()
+        await self._recover_outbox()
+        async with self._create_session() as self._session:
+            self._fetcher = FeedFetcher(self._session, self._store)
+            if self._args.startup_profile:
+                self._report_startup()
+            while self._is_active:
+                await self._wait_until_due()
+                self._profiler.start_cycle()
+                with CYCLE_DURATION.time():
+                    await self._collect_cycle()
+                self._profiler.end_cycle()
+
+    async def _wait_until_due(self):
+        """
+        Waits until a feed is due, the wait is cut short when the delays of the feeds change.
+        """
+        while self._scheduler.time_until_due() > 0:
+            self._rescheduled.clear()
+            try:
+                await asyncio.wait_for(self._rescheduled.wait(), self._scheduler.time_until_due())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _apply_config(self, config: dict):
+        """
+        Applies a reloaded configuration, the servers and the feed delays are updated without dropping the discord
+        connection or the caches. The other settings take effect on the next start.
+        :param config: The reloaded configuration.
+        """
+        await self._bot.update_servers(config.get("servers") or {})
+        self._config["probe_news_delay"] = config.get("probe_news_delay", self._config["probe_news_delay"])
+        self._config["feeds"] = config.get("feeds")
+        for feed in self._feeds:
+            self._scheduler.set_delays(repr(feed), *self._get_delays(feed))
+        self._rescheduled.set()
+
+    async def _collect_cycle(self):
+        """
+        Collects the news from the feeds that are due, and reschedules them.
+        """
+        due = self._scheduler.pop_due()
+        self._logger.info("Collecting news", feeds=due)
+        self._invalidate_cache()
+
+        polled_at = time.time()
+        fetchers = [self._fetcher.defer_validators() for _ in due]
+        results = await asyncio.gather(*[self._fetch_feed(schedule.feed, fetcher, self._get_min_date(schedule.feed))
+                                         for schedule, fetcher in zip(due, fetchers)])
+        for schedule, fetcher, items in zip(due, fetchers, results):
+            new_item_count = None
+            if items is not None:
+                self._logger.info("Feed processed", feed=schedule.feed, item_count=len(items))
+                new_item_count = await self._handle_feed(schedule.feed, items)
+                # The pages are only skipped from now on, their items being journaled in the outbox.
+                fetcher.save_validators()
+                self._store.set_meta(f'last_post_timestamp.{schedule.feed}', str(polled_at))
 
-            for feed in self._feeds:
-                self._logger.info("Processing feed", feed=feed)
-                items = feed.get(self._config["user_agent"], datetime.datetime.today().date())
+            self._scheduler.reschedule(schedule, new_item_count)
+            self._logger.debug("Feed rescheduled", feed=schedule.feed, delay=schedule.delay)
 
-                self._logger.info("Feed processed", feed=feed, item_count=len(items))
-                await self._handle_feed(feed, items)
+    async def _fetch_feed(self, feed: NewsFeed, fetcher: FeedFetcher,
+                          min_date: datetime.date) -> Optional[List[NewsItem]]:
+        """
+        Fetches a single feed, bounded by the configured feed timeout.
+        :param feed: The feed to fetch.
+        :param fetcher: The fetcher of the feed pages.
+        :param min_date: The minimum date accepted.
+        :return: The fetched news items, or None if the feed failed or timed out.
+        """
+        self._logger.info("Processing feed", feed=feed)
+        try:
+            with FEED_FETCH_DURATION.time(feed=feed):
+                return await asyncio.wait_for(feed.fetch(fetcher, self._config["user_agent"], min_date),
+                                              self._config.get("feed_timeout", 30.0))
+        except asyncio.TimeoutError:
+            self._logger.error("Feed timed out", feed=feed)
+            FEED_ERRORS.inc(feed=feed, reason='timeout')
+        except aiohttp.ClientError as e:
+            self._logger.error("Feed request failed", feed=feed, ex=e)
+            FEED_ERRORS.inc(feed=feed, reason='request')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A malformed page or a failing plugin feed only backs off its own feed.
+            self._logger.error("Unable to parse feed", feed=feed, ex=e)
+            FEED_ERRORS.inc(feed=feed, reason='parse')
+
+        return None
+
+    def _report_startup(self):
+        """
+        Reports the startup profile, up to the first fetch.
+        """
+        PROFILER.mark("first fetch")
+        PROFILER.uninstall()
+        self._logger.info("Startup profile", report=PROFILER.report())
+
+    def _get_min_date(self, feed: NewsFeed) -> datetime.date:
+        """
+        Gets the minimum date of the items to collect from a feed, reaching back to its last successful poll so the
+        items published during a downtime are caught up, but no further back than the item time to live.
+        :param feed: The feed.
+        :return: The minimum date accepted.
+        """
+        today = datetime.datetime.today().date()
+        last_post_timestamp = self._store.get_meta(f'last_post_timestamp.{feed}') or \
+            self._config.get("last_post_timestamp")
+        if not last_post_timestamp:
+            return today
+
+        since = max(float(last_post_timestamp), time.time() - self._config.get("item_ttl", 172800.0))
+        return min(today, datetime.datetime.fromtimestamp(since).date())
 
-            await asyncio.sleep(self._config["probe_news_delay"])
+    def _create_session(self) -> aiohttp.ClientSession:
+        """
+        Creates the shared HTTP session, pooling keep-alive connections across every request.
+        :return: The HTTP session.
+        """
+        http = self._config.get("http", {})
+        connector = aiohttp.TCPConnector(limit=http.get("connection_limit", 100),
+                                         limit_per_host=http.get("connection_limit_per_host", 4),
+                                         keepalive_timeout=http.get("keepalive_timeout", 60.0))
+        return aiohttp.ClientSession(connector=connector)
 
-    async def _handle_feed(self, feed, items):
+    async def _handle_feed(self, feed, items) -> int:
         """
         Handles the feed and processes its items for posting.
         :param feed: The processed feed.
         :param items: The items to process which were pulled from the feed.
+        :return: The amount of new items queued for posting.
         """
-        item_cache = self._config['cache']['items']
-
         self._logger.debug("Creating batch", feed=feed, item_count=len(items))
         batch_color = random.Random(datetime.datetime.today().date().__hash__()).randint(0x0, 0xFFFFFF)
         batch = []
-        for item in [x for x in items if x.url not in item_cache]:
-            self._logger.debug("Adding to batch", batch_len=len(batch), item=item)
-            batch.append(item.to_embed(batch_color, self._icon_manager, f'{feed} @ {item.date}'))
-            item_cache.append(item.url)
+        unseen_items = [x for x in items if not self._store.is_seen(x.url)]
+        ITEM_CACHE.inc(len(items) - len(unseen_items), result='hit')
+        ITEM_CACHE.inc(len(unseen_items), result='miss')
+        new_items = [x for x in unseen_items if not self._deduplicator.is_duplicate(x)]
+        if len(new_items) < len(unseen_items):
+            self._logger.info("Skipping duplicate items", feed=feed, item_count=len(unseen_items) - len(new_items))
+            DUPLICATE_ITEMS.inc(len(unseen_items) - len(new_items))
+
+        with ICON_RESOLVE_DURATION.time():
+            icons = await self._icon_manager.resolve(self._session, [item.origin for item in new_items])
+        with EMBED_BUILD_DURATION.time():
+            for item in new_items:
+                self._logger.debug("Adding to batch", batch_len=len(batch), item=item)
+                batch.append(create_outbox_item(item.url, item.to_embed(batch_color, icons[item.origin],
+                                                                        f'{feed} @ {item.date}')))
 
         if batch:
             self._logger.info("Queuing new items for posting", item_count=len(batch))
-            await DiscordBot(self._args.token, self._config).run(batch)
+            QUEUED_ITEMS.inc(len(batch), feed=feed)
+            self._outbox.enqueue(batch)
+            await self._bot.post(batch)
         else:
             self._logger.info("No new items for posting, skipping batch", feed=feed)
 
-    async def _handle_graceful_terminate(self):
+        return len(batch)
+
+    async def _recover_outbox(self):
         """
-        Handle graceful termination, this task is here to give cpu runtime to handle signals and other system events.
+        Queues the items whose delivery was interrupted by the last shutdown.
         """
-        while self._is_active:
-            await asyncio.sleep(1.0)
+        batch = self._outbox.recover()
+        if batch:
+            self._logger.info("Resuming interrupted deliveries", item_count=len(batch))
+            await self._bot.post(batch)
 
-    def _invalidate_cache(self):
+    def _create_bot(self):
         """
-        Invalidates the cache if it's too old or missing.
+        Creates the posting bot, sharding the servers across worker processes when configured.
+        :return: The bot, or the sharded bot which drives the workers.
         """
-        cache = self._config.get('cache', {'timestamp': time.time(), 'items': []})
-        today = datetime.datetime.today().date()
-        cache_ts = datetime.date.fromtimestamp(cache.get('timestamp', 0))
+        worker_count = self._config.get("workers", 1)
+        if worker_count > 1:
+            return ShardedBot(self._args.token, self._config, self._outbox, worker_count)
 
-        if today > cache_ts:
-            self._logger.info("Item cache is outdated, clearing", ts=cache_ts)
-            cache['timestamp'] = time.time()
-            cache['items'] = []
+        return DiscordBot(self._args.token, self._config, self._outbox, loop=self._loop)
 
-        self._config['cache'] = cache
+    def _create_feeds(self) -> List[NewsFeed]:
+        """
+        Creates the configured feeds, CodeProject alone if none is configured.
+        :return: The feeds.
+        """
+        registry = FeedRegistry()
+        feeds = self._config.get("feeds") or {"CodeProject": {}}
+        created = [registry.create(name, {key: value for key, value in (feed_config or {}).items()
+                                          if key not in self.SCHEDULE_KEYS})
+                   for name, feed_config in feeds.items()]
+        return [feed for feed in created if feed]
 
-    @staticmethod
-    def _get_imgur_client(client_id) -> Optional[ImgurClient]:
+    def _create_metrics_server(self) -> Optional[MetricsServer]:
         """
-        Creates the imgur client instance.
-        :param client_id: The imgur developer client id to be used.
-        :return: The ImgurClient, or None if the client id is not accepted.
+        Creates the local metrics endpoint, if configured.
+        :return: The metrics server, or None if the metrics are not configured.
         """
-        try:
-            return ImgurClient(client_id, None)
-        except ImgurClientError:
+        metrics = self._config.get("metrics")
+        if not metrics:
             return None
 
+        return MetricsServer(REGISTRY, metrics.get("host", "127.0.0.1"), metrics.get("port", 9100))
+
+    def _create_scheduler(self) -> FeedScheduler:
+        """
+        Creates the polling scheduler of the feeds, bounded by their configured delays.
+        :return: The feed scheduler.
+        """
+        scheduler = FeedScheduler()
+        for feed in self._feeds:
+            scheduler.add(FeedSchedule(feed, *self._get_delays(feed)))
+        return scheduler
+
+    def _get_delays(self, feed: NewsFeed) -> Tuple[float, float]:
+        """
+        Gets the configured polling delays of a feed.
+        :param feed: The feed.
+        :return: The minimum and maximum delay(in seconds) between polls.
+        """
+        feed_config = (self._config.get("feeds") or {}).get(repr(feed)) or {}
+        min_delay = feed_config.get("min_delay", self._config["probe_news_delay"])
+        max_delay = feed_config.get("max_delay", max(min_delay, self._config["probe_news_delay"]))
+        return min_delay, max_delay
+
+    async def _handle_graceful_terminate(self):
+        """
+        Handle graceful termination, this task is here to give cpu runtime to handle signals and other system events.
+        """
+        while self._is_active:
+            await asyncio.sleep(1.0)
+
+    def _invalidate_cache(self):
+        """
+        Invalidates the cached items that outlived the item time to live.
+        """
+        expired = self._store.expire_items()
+        if expired:
+            self._logger.info("Expired cached items", item_count=expired)
+
     @staticmethod
     def _load_yaml(file_path) -> Optional[dict]:
         """
@@ -148,8 +363,8 @@ class NewsBot:
 
         try:
             with open(file_path, 'r', encoding='utf-8') as config_file:
-                return yaml.load(config_file.read())
-        except ParserError:
+                return yaml.safe_load(config_file.read())
+        except yaml.YAMLError:
             return None
         except FileNotFoundError:
             return None
@@ -160,13 +375,23 @@ def main():
     args.add_argument('--token', help='The bot token to be used to authenticate against discord', required=True)
     args.add_argument('--imgur', help='The imgur client id to be used for uploading the .ico')
     args.add_argument('--config', help='The config file that contains most of the settings', required=True)
-    args.add_argument('--icons', help='The icons cache file', required=True)
+    args.add_argument('--state', help='The state database file, holding the item and icon caches',
+                      default='state.db')
+    args.add_argument('--icons', help='A legacy icons cache file to import into the state database')
     args.add_argument('--debug', help='Sets the logger to output debug into console',
                       required=False, action='store_true')
+    args.add_argument('--profile', help='Profiles the first N collection cycles, dumping cProfile and tracemalloc data',
+                      type=int, default=0, metavar='N')
+    args.add_argument('--profile-dir', help='The directory the profiling data is dumped to', default='./profiles')
+
+    args.add_argument('--startup-profile', help='Reports the startup phases and the slowest imports',
+                      required=False, action='store_true')
 
     args = args.parse_args()
     Logger.IS_DEBUG = args.debug
 
+    PROFILER.mark("imports")
     news_bot = NewsBot(args)
+    PROFILER.mark("init")
     signal.signal(signal.SIGINT, news_bot.on_signal)
     news_bot.run()
@@ -0,0 +1,87 @@
+import json
+from collections import namedtuple, OrderedDict
+from discord import Embed
+from state_store import StateStore
+from typing import Iterable, List, Set, Tuple
+
+
+OutboxItem = namedtuple('OutboxItem', ['key', 'embed', 'payload'])
+
+
+def create_outbox_item(key: str, embed: Embed) -> OutboxItem:
+    """
+    Creates an outbox item, its embed is encoded once and the payload is reused by every route it's posted to.
+    :param key: The item key.
+    :param embed: The embed to post.
+    :return: The outbox item.
+    """
+    return OutboxItem(key, embed, json.dumps(embed.to_dict(), separators=(',', ':')).encode('utf-8'))
+
+
+def load_outbox_item(key: str, payload: bytes) -> OutboxItem:
+    """
+    Loads an outbox item from its encoded embed.
+    :param key: The item key.
+    :param payload: The encoded embed.
+    :return: The outbox item.
+    """
+    return OutboxItem(key, Embed.from_dict(json.loads(payload)), payload)
+
+
+class Outbox:
+    QUEUED = 'queued'
+    DELIVERED = 'delivered'
+
+    def __init__(self, store: StateStore):
+        self._store = store
+        self._delivered: Set[Tuple[str, str]] = set()
+
+    def enqueue(self, items: List[OutboxItem]):
+        """
+        Journals the items for delivery, and marks them as seen along the way.
+        :param items: The items to deliver.
+        """
+        self._store.enqueue(self.QUEUED, [(item.key, item.payload.decode('utf-8')) for item in items])
+
+    def is_delivered(self, key: str, route: str) -> bool:
+        """
+        Checks whether an item was already delivered to a route.
+        :param key: The item key.
+        :param route: The route key.
+        :return: True if the item was delivered to the route, False otherwise.
+        """
+        return (key, route) in self._delivered
+
+    def mark_delivered(self, keys: Iterable[str], route: str):
+        """
+        Journals the delivery of items to a route.
+        :param keys: The item keys.
+        :param route: The route key.
+        """
+        entries = [(self.DELIVERED, key, route) for key in keys]
+        self._store.append_journal(entries)
+        self._delivered.update((key, route) for _, key, route in entries)
+
+    def complete(self, keys: Iterable[str]):
+        """
+        Drops the journal entries of the items handled by every route, so the journal only ever holds the items that
+        are in flight.
+        :param keys: The item keys.
+        """
+        keys = set(keys)
+        self._store.remove_journal(keys)
+        self._delivered = {(key, route) for key, route in self._delivered if key not in keys}
+
+    def recover(self) -> List[OutboxItem]:
+        """
+        Recovers the items whose delivery was interrupted, the routes they reached are remembered and skipped.
+        :return: The pending items, in their original order.
+        """
+        pending = OrderedDict()
+        for kind, key, route, payload in self._store.read_journal():
+            if kind == self.QUEUED:
+                pending[key] = payload
+            elif kind == self.DELIVERED:
+                self._delivered.add((key, route))
+
+        return [load_outbox_item(key, payload.encode('utf-8')) for key, payload in pending.items()]
@@ -0,0 +1,67 @@
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import tracemalloc
+from logger import Logger
+from typing import Optional
+
+
+class CycleProfiler:
+    def __init__(self, cycles: int, path: str = './profiles', frame_count: int = 10):
+        self._cycles = cycles
+        self._path = path
+        self._frame_count = frame_count
+        self._profile: Optional[cProfile.Profile] = None
+        self._logger = Logger.get_logger()
+
+    @property
+    def is_active(self) -> bool:
+        """
+        Checks whether cycles are left to profile.
+        :return: True if the next cycle is profiled, False otherwise.
+        """
+        return self._cycles > 0
+
+    def start_cycle(self):
+        """
+        Starts profiling a cycle, the memory tracing starts with the first one.
+        """
+        if not self.is_active:
+            return
+
+        if not self._profile:
+            self._profile = cProfile.Profile()
+            tracemalloc.start(self._frame_count)
+        self._profile.enable()
+
+    def end_cycle(self):
+        """
+        Stops profiling a cycle, the profile and memory snapshot are dumped after the last one.
+        """
+        if not self.is_active or not self._profile:
+            return
+
+        self._profile.disable()
+        self._cycles -= 1
+        if not self.is_active:
+            self._dump()
+
+    def _dump(self):
+        """
+        Dumps the profile and the memory snapshot of the profiled cycles, and logs their summary.
+        """
+        os.makedirs(self._path, exist_ok=True)
+        name = os.path.join(self._path, datetime.datetime.now().strftime('cycles-%Y%m%d-%H%M%S'))
+        self._profile.dump_stats(f'{name}.prof')
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(f'{name}.tracemalloc')
+        tracemalloc.stop()
+
+        stats = io.StringIO()
+        pstats.Stats(self._profile, stream=stats).sort_stats('cumulative').print_stats(20)
+        self._logger.info("Profile dumped", profile=f'{name}.prof', snapshot=f'{name}.tracemalloc')
+        self._logger.info("Profile summary", stats=stats.getvalue())
+        self._logger.info("Memory summary", top=[str(stat) for stat in snapshot.statistics('lineno')[:10]])
+        self._profile = None
@@ -0,0 +1,255 @@
+import asyncio
+import copy
+import multiprocessing
+import queue
+import signal
+import zlib
+from bot import Bot
+from logger import Logger
+from metrics import REGISTRY, MetricsServer
+from outbox import Outbox, OutboxItem, load_outbox_item
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+BATCH = 'batch'
+SERVERS = 'servers'
+DONE = 'done'
+# How long(in seconds) an executor thread blocks on a queue at most, so the process can always exit.
+POLL_INTERVAL = 1.0
+
+
+def get_shard_id(server_id: str, shard_count: int) -> int:
+    """
+    Gets the shard owning a server, using the discord sharding formula so each worker's gateway connection only
+    receives the guilds it owns. A server that is not named by its id, e.g. a webhook server, is owned by the shard
+    of a stable hash of its name.
+    :param server_id: The server unique id.
+    :param shard_count: The amount of shards.
+    :return: The shard id.
+    """
+    if not server_id.isdigit():
+        return zlib.crc32(server_id.encode('utf-8')) % shard_count
+    return (int(server_id) >> 22) % shard_count
+
+
+def get_shard_servers(servers: dict, shard_id: int, shard_count: int) -> dict:
+    """
+    Gets the servers owned by a shard.
+    :param servers: The server configuration.
+    :param shard_id: The shard id.
+    :param shard_count: The amount of shards.
+    :return: The configuration of the servers owned by the shard.
+    """
+    return {server_id: server_info for server_id, server_info in servers.items()
+            if get_shard_id(server_id, shard_count) == shard_id}
+
+
+class RemoteOutbox:
+    def __init__(self, worker_id: int, results: multiprocessing.Queue):
+        self._worker_id = worker_id
+        self._results = results
+        self._delivered: Set[Tuple[str, str]] = set()
+
+    def add_delivered(self, delivered: Iterable[Tuple[str, str]]):
+        """
+        Adds the deliveries the collector journaled before a restart.
+        :param delivered: The item and route keys of each delivery.
+        """
+        self._delivered.update(delivered)
+
+    def is_delivered(self, key: str, route: str) -> bool:
+        """
+        Checks whether an item was already delivered to a route.
+        :param key: The item key.
+        :param route: The route key.
+        :return: True if the item was delivered to the route, False otherwise.
+        """
+        return (key, route) in self._delivered
+
+    def mark_delivered(self, keys: Iterable[str], route: str):
+        """
+        Reports the delivery of items to a route to the collector, and remembers it for the items posted again.
+        :param keys: The item keys.
+        :param route: The route key.
+        """
+        keys = list(keys)
+        self._delivered.update((key, route) for key in keys)
+        self._results.put((Outbox.DELIVERED, keys, route))
+
+    def complete(self, keys: Iterable[str]):
+        """
+        Reports the items as handled by every route of this worker to the collector.
+        :param keys: The item keys.
+        """
+        keys = list(keys)
+        self._delivered = {(key, route) for key, route in self._delivered if key not in keys}
+        self._results.put((DONE, keys, self._worker_id))
+
+
+class ShardedBot:
+    def __init__(self, token: str, config, outbox: Outbox, worker_count: int):
+        self._token = token
+        self._config = config
+        self._outbox = outbox
+        self._worker_count = worker_count
+        self._context = multiprocessing.get_context('spawn')
+        self._batches = [self._context.Queue() for _ in range(worker_count)]
+        self._results = self._context.Queue()
+        self._workers = []
+        self._remaining: Dict[str, int] = {}
+        self._results_task = None
+        self._logger = Logger.get_logger()
+
+    async def serve(self):
+        """
+        Starts the worker processes, each owning the servers of its own shard.
+        """
+        for worker_id in range(self._worker_count):
+            worker = self._context.Process(target=run_worker, name=f'NewsBot-worker-{worker_id}', daemon=True,
+                                           args=(worker_id, self._worker_count, self._token, self._config,
+                                                 Logger.IS_DEBUG, self._batches[worker_id], self._results))
+            worker.start()
+            self._workers.append(worker)
+
+        self._logger.info("Started workers", worker_count=self._worker_count)
+        self._results_task = asyncio.ensure_future(self._handle_results())
+
+    async def post(self, batch: List[OutboxItem]):
+        """
+        Hands a rendered batch over to every worker.
+        :param batch: The outbox items to post, already journaled in the outbox.
+        """
+        items = [(item.key, item.payload) for item in batch]
+        delivered = [(item.key, route) for item in batch for route in self._config["servers"]
+                     if self._outbox.is_delivered(item.key, route)]
+        for item in batch:
+            self._remaining[item.key] = self._remaining.get(item.key, 0) + self._worker_count
+
+        for batches in self._batches:
+            batches.put((BATCH, items, delivered))
+
+    async def update_servers(self, servers: dict):
+        """
+        Hands a new server configuration over to every worker, each one keeps the servers of its own shard.
+        :param servers: The new server configuration.
+        """
+        self._config["servers"] = servers
+        for worker_id, batches in enumerate(self._batches):
+            batches.put((SERVERS, get_shard_servers(servers, worker_id, self._worker_count)))
+
+    async def stop(self):
+        """
+        Waits for the workers to post the queued batches and stops them, a worker which does not stop in time is
+        terminated and its batches are recovered on the next start.
+        """
+        loop = asyncio.get_event_loop()
+        for batches in self._batches:
+            batches.put(None)
+        # Each worker waits for its batches within the stop timeout, and then for its disconnection.
+        join_timeout = self._config.get("stop_timeout", 30.0) + 10.0
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.join, join_timeout)
+            if worker.is_alive():
+                self._logger.error("Worker did not stop in time, terminating it", worker=worker.name)
+                worker.terminate()
+
+        self._results.put(None)
+        if self._results_task:
+            await self._results_task
+        self._logger.info("Stopped workers")
+
+    async def _handle_results(self):
+        """
+        Journals the deliveries reported by the workers, an item is done once every worker is done with it.
+        """
+        while True:
+            result = await _get(self._results)
+            if result is None:
+                return
+
+            kind, keys, target = result
+            if kind == Outbox.DELIVERED:
+                self._outbox.mark_delivered(keys, target)
+                continue
+
+            done = []
+            for key in keys:
+                self._remaining[key] -= 1
+                if self._remaining[key] == 0:
+                    del self._remaining[key]
+                    done.append(key)
+            if done:
+                self._outbox.complete(done)
+
+
+def run_worker(worker_id: int, worker_count: int, token: str, config: dict, is_debug: bool,
+               batches: multiprocessing.Queue, results: multiprocessing.Queue):
+    """
+    Runs a worker process, posting the batches it receives to the servers of its shard.
+    :param worker_id: The worker id, which is also its shard id.
+    :param worker_count: The amount of workers, which is also the amount of shards.
+    :param token: The bot token to be used to authenticate against discord.
+    :param config: The bot configuration.
+    :param is_debug: Whether the logger outputs debug.
+    :param batches: The queue of the rendered batches from the collector.
+    :param results: The queue of the delivery reports to the collector.
+    """
+    # The worker is stopped by the collector, once it posted the queued batches.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Logger.NAME = f'{Logger.NAME}-{worker_id}'
+    Logger.IS_DEBUG = is_debug
+    Logger.configure(**config.get("logging", {}))
+    config = copy.deepcopy(config)
+    config["servers"] = get_shard_servers(config["servers"], worker_id, worker_count)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    outbox = RemoteOutbox(worker_id, results)
+    bot = Bot(token, config, outbox, loop=loop, shard_id=worker_id, shard_count=worker_count)
+    # Every worker serves its own delivery metrics, on the ports following the collector's.
+    metrics = config.get("metrics")
+    metrics_server = MetricsServer(REGISTRY, metrics.get("host", "127.0.0.1"),
+                                   metrics.get("port", 9100) + 1 + worker_id) if metrics else None
+    if metrics_server:
+        loop.run_until_complete(metrics_server.start())
+    loop.create_task(bot.serve())
+    loop.run_until_complete(_receive_batches(bot, outbox, batches))
+    loop.run_until_complete(bot.stop())
+    if metrics_server:
+        loop.run_until_complete(metrics_server.stop())
+
+
+async def _receive_batches(bot: Bot, outbox: RemoteOutbox, batches: multiprocessing.Queue):
+    """
+    Receives the rendered batches and the server changes from the collector until it asks to stop.
+    :param bot: The bot of the worker.
+    :param outbox: The outbox of the worker.
+    :param batches: The queue of the rendered batches from the collector.
+    """
+    while True:
+        message = await _get(batches)
+        if message is None:
+            return
+
+        if message[0] == SERVERS:
+            await bot.update_servers(message[1])
+            continue
+
+        _, items, delivered = message
+        outbox.add_delivered(delivered)
+        await bot.post([load_outbox_item(key, payload) for key, payload in items])
+
+
+async def _get(messages: multiprocessing.Queue):
+    """
+    Gets the next message of a queue, an executor thread is never blocked for longer than the poll interval so the
+    process can exit while the queue is idle.
+    :param messages: The queue.
+    :return: The message.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            return await loop.run_in_executor(None, messages.get, True, POLL_INTERVAL)
+        except queue.Empty:
+            pass
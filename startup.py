@@ -0,0 +1,79 @@
+import builtins
+import sys
+import time
+from typing import Dict, List, Tuple
+
+
+STARTED_AT = time.perf_counter()
+
+
+class StartupProfiler:
+    def __init__(self):
+        self._imports: Dict[str, Tuple[float, float]] = {}
+        self._phases: List[Tuple[str, float]] = []
+        self._stack: List[float] = []
+        self._import = None
+
+    @property
+    def is_installed(self) -> bool:
+        """
+        Checks whether the imports are being timed.
+        :return: True if the profiler is installed, False otherwise.
+        """
+        return self._import is not None
+
+    def install(self):
+        """
+        Starts timing the imports of modules that are not loaded yet, like python -X importtime.
+        """
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        """
+        Stops timing the imports.
+        """
+        if self._import:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def mark(self, phase: str):
+        """
+        Marks the end of a startup phase.
+        :param phase: The phase name.
+        """
+        self._phases.append((phase, time.perf_counter() - STARTED_AT))
+
+    def report(self, count: int = 15) -> str:
+        """
+        Reports the startup phases and the slowest imports.
+        :param count: The amount of imports to report.
+        :return: The report.
+        """
+        lines = [f'{phase:<24} {elapsed * 1000:10.1f}ms' for phase, elapsed in self._phases]
+        lines.append(f'{"import":<40} {"self":>10} {"cumulative":>12}')
+        slowest = sorted(self._imports.items(), key=lambda entry: entry[1][1], reverse=True)[:count]
+        lines.extend(f'{name:<40} {self_time * 1000:8.1f}ms {cumulative * 1000:10.1f}ms'
+                     for name, (self_time, cumulative) in slowest)
+        return '\n'.join(lines)
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """
+        Imports a module, timing it if it's not loaded yet.
+        """
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        started_at = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - started_at
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += cumulative
+            self._imports[name] = (cumulative - nested, cumulative)
+
+
+PROFILER = StartupProfiler()
@@ -0,0 +1,202 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class StateStore:
+    def __init__(self, path: str, item_ttl: float):
+        self._item_ttl = item_ttl
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables()
+
+        self._items: Dict[str, float] = dict(self._connection.execute('SELECT url, seen_at FROM items'))
+        self._icons: Dict[str, str] = dict(self._connection.execute('SELECT hash, url FROM icons'))
+        self._origins: Dict[str, Tuple[Optional[str], float]] = {
+            origin: (url, expires_at)
+            for origin, url, expires_at in self._connection.execute('SELECT origin, url, expires_at FROM origins')}
+
+    def close(self):
+        """
+        Closes the underlying database.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def is_seen(self, url: str) -> bool:
+        """
+        Checks whether the item was already seen within the item time to live.
+        :param url: The url of the item.
+        :return: True if the item was seen, False otherwise.
+        """
+        seen_at = self._items.get(url)
+        return seen_at is not None and seen_at + self._item_ttl > time.time()
+
+    def enqueue(self, kind: str, items: List[Tuple[str, str]]):
+        """
+        Marks the items as seen and journals them for delivery, in a single transaction.
+        :param kind: The kind of entry which marks an item as queued.
+        :param items: The url and the delivery payload of each item.
+        """
+        seen_at = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO items (url, seen_at) VALUES (?, ?)',
+                                         [(url, seen_at) for url, _ in items])
+            self._connection.executemany('INSERT INTO journal (kind, item, payload) VALUES (?, ?, ?)',
+                                         [(kind, url, payload) for url, payload in items])
+        self._items.update((url, seen_at) for url, _ in items)
+
+    def append_journal(self, entries: List[Tuple[str, str, Optional[str]]]):
+        """
+        Appends entries to the delivery journal.
+        :param entries: The kind, item and route of each entry.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT INTO journal (kind, item, route) VALUES (?, ?, ?)', entries)
+
+    def read_journal(self) -> List[Tuple[str, str, Optional[str], Optional[str]]]:
+        """
+        Reads the delivery journal.
+        :return: The kind, item, route and payload of each entry, in the order they were appended.
+        """
+        with self._lock:
+            return self._connection.execute('SELECT kind, item, route, payload FROM journal ORDER BY seq').fetchall()
+
+    def remove_journal(self, items: Iterable[str]):
+        """
+        Drops every journal entry of the items, in a single transaction.
+        :param items: The items.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany('DELETE FROM journal WHERE item = ?', [(item,) for item in items])
+
+    def expire_items(self) -> int:
+        """
+        Drops the items that outlived the item time to live.
+        :return: The amount of expired items.
+        """
+        min_seen_at = time.time() - self._item_ttl
+        expired = [url for url, seen_at in self._items.items() if seen_at <= min_seen_at]
+        if expired:
+            with self._lock, self._connection:
+                self._connection.execute('DELETE FROM items WHERE seen_at <= ?', (min_seen_at,))
+            for url in expired:
+                del self._items[url]
+        return len(expired)
+
+    def get_icon(self, ico_hash: str) -> Optional[str]:
+        """
+        Gets the cached icon url of an icon hash.
+        :param ico_hash: The icon hash from the original .ico file.
+        :return: The icon url from the cache host, or None if not cached.
+        """
+        return self._icons.get(ico_hash)
+
+    def set_icon(self, ico_hash: str, url: str):
+        """
+        Caches the icon url of an icon hash.
+        :param ico_hash: The icon hash from the original .ico file.
+        :param url: The icon url from the cache host.
+        """
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO icons (hash, url) VALUES (?, ?)', (ico_hash, url))
+        self._icons[ico_hash] = url
+
+    def get_origin(self, origin: str) -> Optional[Tuple[Optional[str], float]]:
+        """
+        Gets the resolved icon of a website origin.
+        :param origin: The website origin, e.g. https://www.codeproject.com.
+        :return: The icon url (None if the resolving failed) and its expiry timestamp, or None if never resolved.
+        """
+        return self._origins.get(origin)
+
+    def set_origin(self, origin: str, url: Optional[str], expires_at: float):
+        """
+        Caches the resolved icon of a website origin.
+        :param origin: The website origin, e.g. https://www.codeproject.com.
+        :param url: The icon url, or None if the resolving failed.
+        :param expires_at: The timestamp the entry expires at.
+        """
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO origins (origin, url, expires_at) VALUES (?, ?, ?)',
+                                     (origin, url, expires_at))
+        self._origins[origin] = (url, expires_at)
+
+    def get_validators(self, url: str) -> Optional[Tuple[Optional[str], Optional[str], str]]:
+        """
+        Gets the cache validators of the last retrieval of a feed page.
+        :param url: The URL of the feed page.
+        :return: The ETag, Last-Modified and content digest of the page, or None if never retrieved.
+        """
+        with self._lock:
+            return self._connection.execute('SELECT etag, last_modified, digest FROM validators WHERE url = ?',
+                                            (url,)).fetchone()
+
+    def set_validators(self, url: str, etag: Optional[str], last_modified: Optional[str], digest: str):
+        """
+        Sets the cache validators of the last retrieval of a feed page.
+        :param url: The URL of the feed page.
+        :param etag: The ETag header of the page.
+        :param last_modified: The Last-Modified header of the page.
+        :param digest: The digest of the page content.
+        """
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO validators (url, etag, last_modified, digest) '
+                                     'VALUES (?, ?, ?, ?)', (url, etag, last_modified, digest))
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """
+        Gets a bot state value.
+        :param key: The state key.
+        :return: The state value, or None if never set.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        """
+        Sets a bot state value.
+        :param key: The state key.
+        :param value: The state value.
+        """
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def import_legacy(self, cache: Optional[dict], icons: Optional[dict]):
+        """
+        Imports the YAML based caches of older versions, entries already in the store are kept.
+        :param cache: The legacy item cache from the configuration.
+        :param icons: The legacy icon hashes.
+        """
+        cache = cache or {}
+        items = [(url, cache.get('timestamp', 0.0)) for url in cache.get('items') or [] if url]
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO items (url, seen_at) VALUES (?, ?)', items)
+            self._connection.executemany('INSERT OR IGNORE INTO icons (hash, url) VALUES (?, ?)',
+                                         list((icons or {}).items()))
+
+        for url, seen_at in items:
+            self._items.setdefault(url, seen_at)
+        for ico_hash, url in (icons or {}).items():
+            self._icons.setdefault(ico_hash, url)
+
+    def _create_tables(self):
+        """
+        Creates the store tables, if missing.
+        """
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS items (url TEXT PRIMARY KEY, seen_at REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS items_seen_at ON items (seen_at)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS icons (hash TEXT PRIMARY KEY, url TEXT NOT NULL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS origins '
+                                     '(origin TEXT PRIMARY KEY, url TEXT, expires_at REAL NOT NULL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                     'kind TEXT NOT NULL, item TEXT NOT NULL, route TEXT, payload TEXT)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS journal_item ON journal (item)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS validators '
+                                     '(url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, digest TEXT NOT NULL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from logger import Logger  # noqa: E402
+
+# The log files of the tests are written aside, and dropped along with the temporary directory.
+Logger.DEFAULT_PATH = tempfile.mkdtemp(prefix='news-bot-logs-')
@@ -0,0 +1,231 @@
+import asyncio
+import json
+from aiohttp import ClientConnectionError
+from bot import Bot
+from discord import Embed, HTTPException
+from outbox import Outbox, create_outbox_item
+from state_store import StateStore
+
+
+SERVERS = {'first': {'webhook_url': 'https://example.com/first'},
+           'second': {'webhook_url': 'https://example.com/second'}}
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.name = 'programming-news'
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f'guild-{guild_id}'
+        self.channels = [FakeChannel(guild_id)]
+        self.emojis = []
+
+
+class GatewayBot(Bot):
+    """
+    The bot over a simulated discord connection, the messages sent to a channel are recorded.
+    """
+
+    def __init__(self, outbox: Outbox, guilds, stop_timeout: float = 30.0):
+        super().__init__('token', {"servers": {'1': {'channel': 'programming-news'},
+                                               '2': {'channel': 'programming-news'}},
+                                   "stop_timeout": stop_timeout}, outbox)
+        self.fake_guilds = guilds
+        self.sent = []
+        self.is_sending = asyncio.Event()
+        self.is_sending.set()
+
+    @property
+    def guilds(self):
+        return self.fake_guilds
+
+    def start_posting(self):
+        self._batch_task = asyncio.ensure_future(self._handle_batches())
+
+    def get_route_ids(self):
+        return sorted(route.server.id for route in self._routing_info)
+
+    async def _send_message(self, channel, body: bytes) -> dict:
+        await self.is_sending.wait()
+        self.sent.append((channel.id, [embed['title'] for embed in json.loads(body)['embeds']]))
+        return {'id': str(len(self.sent))}
+
+
+class FakeResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = 'Error'
+
+
+def _create_items(*keys):
+    return [create_outbox_item(key, Embed(title=key)) for key in keys]
+
+
+def _run_bot(tmp_path, send, *batches):
+    store = StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0)
+    outbox = Outbox(store)
+
+    async def run():
+        bot = Bot('token', {"servers": SERVERS}, outbox)
+        await bot.serve()
+        bot._webhooks.send = send
+        for batch in batches:
+            outbox.enqueue(batch)
+            await bot.post(batch)
+            await bot.wait_until_posted()
+        await bot.stop()
+
+    asyncio.run(run())
+    return store, outbox
+
+
+def test_transient_failure_is_posted_with_the_next_batch(tmp_path):
+    posted = []
+    failures = [ClientConnectionError('Connection reset')]
+
+    async def send(url, body):
+        if url.endswith('second') and failures:
+            raise failures.pop()
+        posted.append((url.rsplit('/', 1)[1], [embed['title'] for embed in json.loads(body)['embeds']]))
+
+    store, outbox = _run_bot(tmp_path, send, _create_items('a'), _create_items('b'))
+
+    assert sorted(posted) == [('first', ['a']), ('first', ['b']), ('second', ['a']), ('second', ['b'])]
+    assert store.read_journal() == []
+    store.close()
+
+
+def test_transient_failure_stays_journaled(tmp_path):
+    async def send(url, body):
+        if url.endswith('second'):
+            raise HTTPException(FakeResponse(503), 'Service unavailable')
+
+    store, _ = _run_bot(tmp_path, send, _create_items('a'))
+
+    outbox = Outbox(store)
+    assert [item.key for item in outbox.recover()] == ['a']
+    assert outbox.is_delivered('a', 'first')
+    assert not outbox.is_delivered('a', 'second')
+    store.close()
+
+
+def test_permanent_failure_is_completed(tmp_path):
+    async def send(url, body):
+        if url.endswith('second'):
+            raise HTTPException(FakeResponse(400), 'Bad request')
+
+    store, _ = _run_bot(tmp_path, send, _create_items('a'))
+
+    assert store.read_journal() == []
+    store.close()
+
+
+def test_routes_follow_the_guild_events():
+    async def run():
+        bot = GatewayBot(Outbox(StateStore(':memory:', 3600.0)), [FakeGuild(1)])
+        await bot.on_ready()
+        route_ids = [bot.get_route_ids()]
+        await bot.on_guild_join(FakeGuild(2))
+        await bot.on_guild_join(FakeGuild(3))
+        route_ids.append(bot.get_route_ids())
+        await bot.on_guild_remove(FakeGuild(1))
+        route_ids.append(bot.get_route_ids())
+        await bot.on_guild_available(FakeGuild(1))
+        route_ids.append(bot.get_route_ids())
+        return route_ids
+
+    assert asyncio.run(run()) == [[1], [1, 2], [2], [1, 2]]
+
+
+def test_consumer_survives_a_failing_batch(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0)
+    outbox = Outbox(store)
+    complete = outbox.complete
+    failures = [RuntimeError('Database is locked')]
+
+    def fail_once(keys):
+        if failures:
+            raise failures.pop()
+        complete(keys)
+
+    outbox.complete = fail_once
+
+    async def run():
+        bot = GatewayBot(outbox, [FakeGuild(1)])
+        bot.start_posting()
+        await bot.on_ready()
+        for batch in [_create_items('a'), _create_items('b')]:
+            outbox.enqueue(batch)
+            await bot.post(batch)
+            await bot.wait_until_posted()
+        return bot.sent
+
+    assert asyncio.run(run()) == [(1, ['a']), (1, ['b'])]
+    # The batch which failed to complete stays journaled, it's recovered on the next start.
+    assert [item.key for item in Outbox(store).recover()] == ['a']
+    store.close()
+
+
+def test_stop_gives_up_on_the_queued_batches_after_the_timeout(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0)
+    outbox = Outbox(store)
+
+    async def run():
+        bot = GatewayBot(outbox, [FakeGuild(1)], stop_timeout=0.1)
+        bot.is_sending.clear()
+        bot.start_posting()
+        await bot.on_ready()
+        outbox.enqueue(_create_items('a'))
+        await bot.post(_create_items('a'))
+        await asyncio.wait_for(bot.stop(), 1.0)
+
+    asyncio.run(run())
+
+    assert [item.key for item in Outbox(store).recover()] == ['a']
+    store.close()
+
+
+def test_batch_queued_before_the_routes_waits_for_them(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0)
+    outbox = Outbox(store)
+
+    async def run():
+        bot = GatewayBot(outbox, [FakeGuild(1), FakeGuild(2)])
+        bot.start_posting()
+        outbox.enqueue(_create_items('a'))
+        await bot.post(_create_items('a'))
+        # As discord.py does, the client is ready before the ready event handlers build the routes.
+        bot._connection.call_handlers('ready')
+        bot.dispatch('ready')
+        await asyncio.wait_for(bot.wait_until_posted(), 1.0)
+        return sorted(bot.sent)
+
+    assert asyncio.run(run()) == [(1, ['a']), (2, ['a'])]
+    assert store.read_journal() == []
+    store.close()
+
+
+def test_batch_waits_for_the_session_to_resume(tmp_path):
+    async def run():
+        bot = GatewayBot(Outbox(StateStore(':memory:', 3600.0)), [FakeGuild(1)])
+        bot.start_posting()
+        await bot.on_ready()
+        await bot.on_disconnect()
+        await bot.post(_create_items('a'))
+        await asyncio.sleep(0.05)
+        sent_while_disconnected = list(bot.sent)
+        await bot.on_resumed()
+        await asyncio.wait_for(bot.wait_until_posted(), 1.0)
+        return sent_while_disconnected, bot.sent
+
+    assert asyncio.run(run()) == ([], [(1, ['a'])])
+
+
+def test_server_with_reactions_is_posted_to_over_the_connection():
+    assert Bot._is_webhook_server({'webhook_url': 'https://example.com/hook'})
+    assert not Bot._is_webhook_server({'webhook_url': 'https://example.com/hook', 'reactions': ['👀']})
+    assert not Bot._is_webhook_server({'channel': 'programming-news'})
@@ -0,0 +1,60 @@
+import pytest
+from news.dedup import Deduplicator, normalize_url
+from news.item import NewsItem
+
+
+def _create_item(title: str, url: str) -> NewsItem:
+    return NewsItem(title, '', url, '', 'News', '')
+
+
+def test_normalize_url_drops_tracking_variants():
+    assert normalize_url('http://www.Example.com:80/news/?utm_source=feed&b=2&a=1#top') == \
+        'https://example.com/news?a=1&b=2'
+    assert normalize_url('https://example.com:8443/news?fbclid=abc') == 'https://example.com:8443/news'
+
+
+def test_url_variant_is_duplicate():
+    deduplicator = Deduplicator()
+
+    assert not deduplicator.is_duplicate(_create_item('Some news', 'https://example.com/news?id=1'))
+    assert deduplicator.is_duplicate(_create_item('Other title', 'http://www.example.com/news/?id=1&utm_medium=x'))
+
+
+def test_near_duplicate_title_of_the_same_website():
+    deduplicator = Deduplicator()
+
+    assert not deduplicator.is_duplicate(_create_item('Microsoft announces new Windows features for developers',
+                                                      'https://example.com/news/1'))
+    assert deduplicator.is_duplicate(_create_item('Microsoft announces new Windows features for developers!',
+                                                  'https://example.com/news/2'))
+
+
+def test_near_duplicate_title_of_another_website_is_kept():
+    deduplicator = Deduplicator()
+
+    assert not deduplicator.is_duplicate(_create_item('Microsoft announces new Windows features for developers',
+                                                      'https://example.com/news/1'))
+    assert not deduplicator.is_duplicate(_create_item('Microsoft announces new Windows features for developers',
+                                                      'https://example.org/news/1'))
+
+
+def test_titles_with_other_numbers_are_kept():
+    deduplicator = Deduplicator()
+
+    assert not deduplicator.is_duplicate(_create_item('Announcing TypeScript 5.5 release candidate',
+                                                      'https://example.com/typescript-5-5'))
+    assert not deduplicator.is_duplicate(_create_item('Announcing TypeScript 5.6 release candidate',
+                                                      'https://example.com/typescript-5-6'))
+
+
+def test_fingerprints_expire_with_the_window():
+    deduplicator = Deduplicator(window=0.0)
+
+    assert not deduplicator.is_duplicate(_create_item('Some news', 'https://example.com/news/1'))
+    assert not deduplicator.is_duplicate(_create_item('Some news', 'https://example.com/news/2'))
+
+
+@pytest.mark.parametrize('max_distance', [-1, 4])
+def test_invalid_max_distance(max_distance):
+    with pytest.raises(ValueError):
+        Deduplicator(max_distance=max_distance)
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+import pytest
+from delivery import DeliveryScheduler, RateLimitBucket, encode_embeds, pack_embeds
+from discord import HTTPException
+
+
+class FakeResponse:
+    def __init__(self, status: int, headers: dict):
+        self.status = status
+        self.reason = 'Error'
+        self.headers = headers
+
+
+def test_pack_embeds_limits_the_embed_count():
+    groups = pack_embeds(list(range(25)), size=lambda _: 1)
+
+    assert [len(group) for group in groups] == [10, 10, 5]
+    assert [embed for group in groups for embed in group] == list(range(25))
+
+
+def test_pack_embeds_limits_the_characters():
+    groups = pack_embeds(['a' * 2500, 'b' * 2500, 'c' * 1000, 'd' * 10])
+
+    assert [[len(embed) for embed in group] for group in groups] == [[2500, 2500, 1000], [10]]
+
+
+def test_pack_embeds_keeps_an_oversized_embed_alone():
+    groups = pack_embeds(['a' * 10, 'b' * 7000, 'c' * 10])
+
+    assert [[len(embed) for embed in group] for group in groups] == [[10], [7000], [10]]
+
+
+def test_pack_embeds_of_nothing():
+    assert pack_embeds([]) == []
+
+
+def test_encode_embeds():
+    body = encode_embeds([b'{"title":"a"}', b'{"title":"b"}'])
+
+    assert json.loads(body) == {'embeds': [{'title': 'a'}, {'title': 'b'}]}
+
+
+def test_rate_limit_bucket_waits_for_the_reset():
+    async def run():
+        bucket = RateLimitBucket()
+        bucket.update({'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset-After': '0.2'})
+        started_at = time.monotonic()
+        await bucket.acquire()
+        first = time.monotonic() - started_at
+        await bucket.acquire()
+        return first, time.monotonic() - started_at
+
+    first, second = asyncio.run(run())
+
+    assert first < 0.1
+    assert second >= 0.15
+
+
+def test_rate_limit_bucket_ignores_responses_without_headers():
+    async def run():
+        bucket = RateLimitBucket()
+        bucket.update({})
+        started_at = time.monotonic()
+        for _ in range(10):
+            await bucket.acquire()
+        return time.monotonic() - started_at
+
+    assert asyncio.run(run()) < 0.1
+
+
+def test_call_retries_after_a_rate_limit():
+    attempts = []
+
+    async def request():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise HTTPException(FakeResponse(429, {'Retry-After': '0.1'}), 'You are being rate limited.')
+        return 'sent'
+
+    assert asyncio.run(DeliveryScheduler().call('channel', request)) == 'sent'
+    assert attempts[1] - attempts[0] >= 0.09
+
+
+def test_call_gives_up_after_the_retries():
+    attempts = []
+
+    async def request():
+        attempts.append(None)
+        raise HTTPException(FakeResponse(429, {'Retry-After': '0.01'}), 'You are being rate limited.')
+
+    with pytest.raises(HTTPException):
+        asyncio.run(DeliveryScheduler(max_retries=2).call('channel', request))
+    assert len(attempts) == 3
+
+
+def test_call_does_not_retry_other_errors():
+    attempts = []
+
+    async def request():
+        attempts.append(None)
+        raise HTTPException(FakeResponse(500, {}), 'Server error')
+
+    with pytest.raises(HTTPException):
+        asyncio.run(DeliveryScheduler().call('channel', request))
+    assert len(attempts) == 1
+
+
+def test_fan_out_isolates_failing_routes():
+    delivered = []
+
+    async def deliver(route):
+        if route == 'broken':
+            raise RuntimeError('Unable to deliver')
+        await asyncio.sleep(0)
+        delivered.append(route)
+
+    async def run():
+        await DeliveryScheduler().fan_out(['first', 'broken', 'second'], deliver)
+
+    asyncio.run(run())
+
+    assert sorted(delivered) == ['first', 'second']
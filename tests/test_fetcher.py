@@ -0,0 +1,61 @@
+import asyncio
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+from news.fetcher import FeedFetcher
+from state_store import StateStore
+
+
+def _create_app(requests: list) -> web.Application:
+    async def handle_feed(request: web.Request) -> web.Response:
+        requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=b'<rss/>', headers={'ETag': '"v1"'})
+
+    async def handle_static(request: web.Request) -> web.Response:
+        requests.append(request.headers.get('If-None-Match'))
+        return web.Response(body=b'<rss/>')
+
+    app = web.Application()
+    app.router.add_get('/feed', handle_feed)
+    app.router.add_get('/static', handle_static)
+    return app
+
+
+def test_deferred_validators_are_saved_once_handled(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0)
+    requests = []
+
+    async def run():
+        async with TestServer(_create_app(requests)) as server, ClientSession() as session:
+            url = str(server.make_url('/feed'))
+            fetcher = FeedFetcher(session, store).defer_validators()
+
+            assert await fetcher.get(url, 'ua') == b'<rss/>'
+            assert store.get_validators(url) is None
+            # A poll that failed before its items were journaled retrieves the page again.
+            assert await fetcher.defer_validators().get(url, 'ua') == b'<rss/>'
+
+            fetcher.save_validators()
+            assert store.get_validators(url)[0] == '"v1"'
+            assert await FeedFetcher(session, store).get(url, 'ua') is None
+
+    asyncio.run(run())
+
+    assert requests == [None, None, '"v1"']
+    store.close()
+
+
+def test_unchanged_page_without_validators_is_skipped(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0)
+    requests = []
+
+    async def run():
+        async with TestServer(_create_app(requests)) as server, ClientSession() as session:
+            url = str(server.make_url('/static'))
+            fetcher = FeedFetcher(session, store)
+            return [await fetcher.get(url, 'ua'), await fetcher.get(url, 'ua')]
+
+    assert asyncio.run(run()) == [b'<rss/>', None]
+    assert requests == [None, None]
+    store.close()
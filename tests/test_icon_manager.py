@@ -0,0 +1,50 @@
+import asyncio
+from icon_manager import IconManager
+from state_store import StateStore
+
+
+ORIGIN = 'https://example.com'
+
+
+def _create_icon_manager(tmp_path) -> IconManager:
+    return IconManager(None, StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0), 'ua')
+
+
+def test_cancelled_lookup_releases_the_waiters(tmp_path):
+    icon_manager = _create_icon_manager(tmp_path)
+
+    async def get(session, url):
+        await asyncio.Event().wait()
+
+    icon_manager._get = get
+
+    async def run():
+        owner = asyncio.ensure_future(icon_manager.get(None, ORIGIN))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(icon_manager.get(None, ORIGIN))
+        await asyncio.sleep(0)
+        owner.cancel()
+        return await asyncio.wait_for(waiter, 1.0), owner.cancelled()
+
+    assert asyncio.run(run()) == (None, True)
+    # The cancelled lookup is not cached as a failure, the next one retries the website.
+    assert icon_manager._store.get_origin(ORIGIN) is None
+
+
+def test_concurrent_lookups_share_a_single_request(tmp_path):
+    icon_manager = _create_icon_manager(tmp_path)
+    requests = []
+
+    async def get(session, url):
+        requests.append(url)
+        await asyncio.sleep(0.01)
+        return f'{url}/favicon.ico'
+
+    icon_manager._get = get
+
+    async def run():
+        return await asyncio.gather(*[icon_manager.get(None, ORIGIN) for _ in range(3)])
+
+    assert asyncio.run(run()) == [f'{ORIGIN}/favicon.ico'] * 3
+    assert requests == [ORIGIN]
+    assert icon_manager._store.get_origin(ORIGIN)[0] == f'{ORIGIN}/favicon.ico'
@@ -0,0 +1,46 @@
+import argparse
+import asyncio
+import yaml
+from metrics import FEED_ERRORS
+from news.feed import NewsFeed
+from news.item import NewsItem
+from news_bot import NewsBot
+
+
+class FakeFeed(NewsFeed):
+    def __init__(self, name: str, error: Exception = None):
+        super().__init__(name)
+        self.error = error
+
+    async def fetch(self, fetcher, ua, min_date, *args, **kwargs):
+        if self.error:
+            raise self.error
+        return [NewsItem('News', '', f'https://example.com/{self.name}', 'example.com', 'News', '')]
+
+
+def _create_news_bot(tmp_path) -> NewsBot:
+    config_path = tmp_path / 'config.yaml'
+    config_path.write_text(yaml.safe_dump({'user_agent': 'ua', 'probe_news_delay': 600.0, 'feed_timeout': 1.0,
+                                           'servers': {}}))
+    return NewsBot(argparse.Namespace(token='token', imgur=None, config=str(config_path), icons=None,
+                                      state=str(tmp_path / 'state.db'), debug=False, profile=0, profile_dir=None,
+                                      startup_profile=False))
+
+
+def test_failing_feed_does_not_stop_the_others(tmp_path):
+    # The news bot runs on the current event loop, as it does from main.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    news_bot = _create_news_bot(tmp_path)
+    feeds = [FakeFeed('Broken', ValueError('Unknown date format')), FakeFeed('Working')]
+    try:
+        broken, working = loop.run_until_complete(
+            asyncio.gather(*[news_bot._fetch_feed(feed, None, None) for feed in feeds]))
+    finally:
+        news_bot.close()
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    assert broken is None
+    assert [item.url for item in working] == ['https://example.com/Working']
+    assert any('feed="Broken"' in line and 'reason="parse"' in line for line in FEED_ERRORS.render())
@@ -0,0 +1,41 @@
+from discord import Embed
+from outbox import Outbox, create_outbox_item
+from state_store import StateStore
+
+
+def _create_store(tmp_path) -> StateStore:
+    return StateStore(str(tmp_path / 'state.db'), item_ttl=3600.0)
+
+
+def test_recover_skips_delivered_routes(tmp_path):
+    store = _create_store(tmp_path)
+    outbox = Outbox(store)
+    outbox.enqueue([create_outbox_item(f'https://example.com/{i}', Embed(title=f'News {i}')) for i in range(3)])
+    outbox.mark_delivered(['https://example.com/0', 'https://example.com/1'], 'guild-1')
+    store.close()
+
+    store = _create_store(tmp_path)
+    outbox = Outbox(store)
+    items = outbox.recover()
+
+    assert [item.key for item in items] == [f'https://example.com/{i}' for i in range(3)]
+    assert [item.embed.title for item in items] == ['News 0', 'News 1', 'News 2']
+    assert outbox.is_delivered('https://example.com/0', 'guild-1')
+    assert outbox.is_delivered('https://example.com/1', 'guild-1')
+    assert not outbox.is_delivered('https://example.com/2', 'guild-1')
+    assert not outbox.is_delivered('https://example.com/0', 'guild-2')
+    assert store.is_seen('https://example.com/2')
+    store.close()
+
+
+def test_complete_drops_the_journal(tmp_path):
+    store = _create_store(tmp_path)
+    outbox = Outbox(store)
+    outbox.enqueue([create_outbox_item(f'https://example.com/{i}', Embed(title=f'News {i}')) for i in range(2)])
+    outbox.mark_delivered(['https://example.com/0'], 'guild-1')
+    outbox.complete(['https://example.com/0'])
+
+    assert not outbox.is_delivered('https://example.com/0', 'guild-1')
+    assert [key for _, key, _, _ in store.read_journal()] == ['https://example.com/1']
+    assert [item.key for item in Outbox(store).recover()] == ['https://example.com/1']
+    store.close()
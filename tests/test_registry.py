@@ -0,0 +1,30 @@
+from news.feeds import CodeProject, RssFeed
+from news.registry import FeedRegistry
+
+
+def test_feed_type_defaults_to_its_name():
+    feed = FeedRegistry().create('CodeProject', {'max_pages': 2})
+
+    assert isinstance(feed, CodeProject)
+    assert feed.max_pages == 2
+
+
+def test_rss_feed_from_its_options():
+    feed = FeedRegistry().create('HackerNews', {'type': 'RSS', 'url': 'https://example.com/rss', 'item_type': 'HN'})
+
+    assert isinstance(feed, RssFeed)
+    assert (repr(feed), feed.url, feed.item_type) == ('HackerNews', 'https://example.com/rss', 'HN')
+
+
+def test_feed_type_by_import_path():
+    feed = FeedRegistry().create('Local', {'type': 'news.feeds.rss:RssFeed', 'url': 'https://example.com/rss'})
+
+    assert isinstance(feed, RssFeed)
+
+
+def test_unknown_feed_type_or_options_are_skipped():
+    registry = FeedRegistry()
+
+    assert registry.create('Missing', {}) is None
+    assert registry.create('Local', {'type': 'news.feeds.rss:Missing'}) is None
+    assert registry.create('HackerNews', {'type': 'RSS', 'url': 'https://example.com/rss', 'color': 'red'}) is None
@@ -0,0 +1,71 @@
+import asyncio
+import contextlib
+import datetime
+from news.feeds.rss import RssFeed
+
+
+TODAY = datetime.date(2024, 6, 10)
+
+
+def _create_feed(dates) -> bytes:
+    items = ''.join(f'<item><title>News {i}</title><link>https://example.com/news/{i}</link>'
+                    f'<description>&lt;p&gt;Some &lt;b&gt;news&lt;/b&gt;&lt;/p&gt;</description>'
+                    f'<pubDate>{date.strftime("%a, %d %b %Y 10:00:00 +0000")}</pubDate></item>'
+                    for i, date in enumerate(dates))
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Feed</title>{items}</channel></rss>'.encode()
+
+
+class FakeContent:
+    def __init__(self, raw: bytes, chunk_size: int):
+        self.chunks = [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+        self.read_count = 0
+
+    async def iter_chunked(self, _):
+        for chunk in self.chunks:
+            self.read_count += 1
+            yield chunk
+
+
+class FakeResponse:
+    def __init__(self, content: FakeContent):
+        self.content = content
+
+
+class FakeFetcher:
+    def __init__(self, response):
+        self._response = response
+
+    @contextlib.asynccontextmanager
+    async def stream(self, url, ua):
+        yield self._response
+
+
+def test_fetch_stops_at_the_first_old_item():
+    dates = [TODAY] * 3 + [TODAY - datetime.timedelta(days=2)] + [TODAY] * 50
+    content = FakeContent(_create_feed(dates), chunk_size=256)
+
+    items = asyncio.run(RssFeed('Feed', 'https://example.com/feed').fetch(FakeFetcher(FakeResponse(content)), 'ua',
+                                                                          TODAY - datetime.timedelta(days=1)))
+
+    assert [item.title for item in items] == ['News 0', 'News 1', 'News 2']
+    assert items[0].subtitle == 'Some news'
+    assert items[0].source == 'example.com'
+    assert items[0].date == '10 Jun 2024'
+    assert content.read_count < len(content.chunks) // 2
+
+
+def test_fetch_of_an_unchanged_feed():
+    items = asyncio.run(RssFeed('Feed', 'https://example.com/feed').fetch(FakeFetcher(None), 'ua', TODAY))
+
+    assert items == []
+
+
+def test_fetch_of_an_atom_feed():
+    raw = (b'<?xml version="1.0"?><feed xmlns="http://www.w3.org/2005/Atom">'
+           b'<entry><title>Atom news</title><link rel="alternate" href="https://example.org/atom"/>'
+           b'<summary>Summary</summary><updated>2024-06-10T08:00:00Z</updated></entry></feed>')
+
+    items = asyncio.run(RssFeed('Feed', 'https://example.org/feed').fetch(None, 'ua', TODAY, raw=raw))
+
+    assert [(item.title, item.url, item.subtitle) for item in items] == [('Atom news', 'https://example.org/atom',
+                                                                          'Summary')]
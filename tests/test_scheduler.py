@@ -0,0 +1,56 @@
+import time
+from news.scheduler import FeedSchedule, FeedScheduler
+
+
+def test_schedule_backs_off_without_new_items():
+    schedule = FeedSchedule('feed', min_delay=10.0, max_delay=60.0)
+
+    delays = []
+    for _ in range(4):
+        schedule.adapt(0)
+        delays.append(schedule.delay)
+    schedule.adapt(None)
+
+    assert delays == [20.0, 40.0, 60.0, 60.0]
+    assert schedule.delay == 60.0
+
+
+def test_schedule_speeds_up_with_new_items():
+    schedule = FeedSchedule('feed', min_delay=10.0, max_delay=60.0)
+    schedule.delay = 60.0
+
+    schedule.adapt(3)
+    assert schedule.delay == 30.0
+    schedule.adapt(1)
+    schedule.adapt(5)
+    assert schedule.delay == 10.0
+    assert schedule.due > time.monotonic() + 9.0
+
+
+def test_scheduler_pops_due_feeds():
+    scheduler = FeedScheduler()
+    due, later = FeedSchedule('due', 10.0, 60.0), FeedSchedule('later', 10.0, 60.0)
+    later.due += 30.0
+    scheduler.add(later)
+    scheduler.add(due)
+
+    assert scheduler.pop_due() == [due]
+    assert 29.0 < scheduler.time_until_due() <= 30.0
+
+
+def test_scheduler_waits_the_idle_delay_without_feeds():
+    assert FeedScheduler(idle_delay=5.0).time_until_due() == 5.0
+
+
+def test_set_delays_brings_the_next_poll_forward():
+    scheduler = FeedScheduler()
+    schedule = FeedSchedule('feed', 10.0, 600.0)
+    scheduler.reschedule(schedule, 0)
+    schedule.delay = 600.0
+    schedule.due = time.monotonic() + 600.0
+    scheduler.add(schedule)
+
+    scheduler.set_delays(repr('feed'), 5.0, 30.0)
+
+    assert schedule.delay == 30.0
+    assert scheduler.time_until_due() <= 30.0
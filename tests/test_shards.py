@@ -0,0 +1,48 @@
+import asyncio
+import queue
+import threading
+import shards
+from outbox import Outbox
+from shards import DONE, RemoteOutbox, get_shard_id, get_shard_servers
+
+
+def test_shard_id_of_a_numeric_server_id():
+    assert get_shard_id(str(81384788765712384), 4) == (81384788765712384 >> 22) % 4
+
+
+def test_shard_id_of_a_named_server_is_stable():
+    shard_id = get_shard_id('<webhook-server>', 4)
+
+    assert 0 <= shard_id < 4
+    assert get_shard_id('<webhook-server>', 4) == shard_id
+
+
+def test_every_server_is_owned_by_a_single_shard():
+    servers = {str(i << 22): {} for i in range(8)}
+    servers.update({'<placeholder>': {}, 'webhooks': {}})
+
+    shards = [get_shard_servers(servers, shard_id, 3) for shard_id in range(3)]
+
+    assert sorted(server_id for shard in shards for server_id in shard) == sorted(servers)
+
+
+def test_remote_outbox_reports_to_the_collector():
+    results = queue.Queue()
+    outbox = RemoteOutbox(1, results)
+
+    outbox.mark_delivered(['a', 'b'], 'guild-1')
+    delivered = outbox.is_delivered('a', 'guild-1'), outbox.is_delivered('a', 'guild-2')
+    outbox.complete(['a'])
+
+    assert delivered == (True, False)
+    assert not outbox.is_delivered('a', 'guild-1')
+    assert outbox.is_delivered('b', 'guild-1')
+    assert [results.get_nowait() for _ in range(2)] == [(Outbox.DELIVERED, ['a', 'b'], 'guild-1'), (DONE, ['a'], 1)]
+
+
+def test_queue_is_read_past_the_poll_interval(monkeypatch):
+    monkeypatch.setattr(shards, 'POLL_INTERVAL', 0.01)
+    messages = queue.Queue()
+    threading.Timer(0.05, messages.put, ('batch',)).start()
+
+    assert asyncio.run(asyncio.wait_for(shards._get(messages), 1.0)) == 'batch'
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from delivery import DeliveryScheduler, encode_embeds
+from discord import NotFound
+from webhook import WebhookClient
+
+
+def _create_app(requests: list) -> web.Application:
+    async def handle_webhook(request: web.Request) -> web.Response:
+        requests.append((request.query.get('wait'), request.content_type, await request.json()))
+        if len(requests) == 1:
+            return web.json_response({'message': 'You are being rate limited.'}, status=429,
+                                     headers={'Retry-After': '0.05'})
+        return web.json_response({'id': '1'}, headers={'X-RateLimit-Remaining': '4',
+                                                       'X-RateLimit-Reset-After': '1.0'})
+
+    app = web.Application()
+    app.router.add_post('/api/webhooks/1/token', handle_webhook)
+    return app
+
+
+def _send(path: str, requests: list) -> dict:
+    async def run():
+        async with TestServer(_create_app(requests)) as server:
+            webhooks = WebhookClient(DeliveryScheduler())
+            await webhooks.open()
+            try:
+                return await webhooks.send(str(server.make_url(path)), encode_embeds([b'{"title":"News"}']))
+            finally:
+                await webhooks.close()
+
+    return asyncio.run(run())
+
+
+def test_send_retries_a_rate_limited_webhook():
+    requests = []
+
+    assert _send('/api/webhooks/1/token', requests) == {'id': '1'}
+    assert requests == [('true', 'application/json', {'embeds': [{'title': 'News'}]})] * 2
+
+
+def test_send_to_a_deleted_webhook():
+    with pytest.raises(NotFound):
+        _send('/api/webhooks/2/token', [])
@@ -0,0 +1,88 @@
+import json
+from collections import namedtuple
+from aiohttp import BytesPayload, ClientSession, ClientResponse, TCPConnector
+from discord import HTTPException, Forbidden, NotFound
+from discord.http import Route
+from delivery import DeliveryScheduler
+from typing import Dict, Hashable, Optional, Union
+
+
+WebhookRoute = namedtuple('WebhookRoute', ['server_id', 'url', 'pack_embeds'])
+
+
+class WebhookClient:
+    def __init__(self, scheduler: DeliveryScheduler, connection_limit: int = 10, keepalive_timeout: float = 60.0):
+        self._scheduler = scheduler
+        self._connection_limit = connection_limit
+        self._keepalive_timeout = keepalive_timeout
+        self._session: Optional[ClientSession] = None
+
+    async def open(self):
+        """
+        Opens the pooled HTTP session the webhooks are executed with.
+        """
+        self._session = ClientSession(connector=TCPConnector(limit=self._connection_limit,
+                                                             keepalive_timeout=self._keepalive_timeout))
+
+    async def close(self):
+        """
+        Closes the pooled HTTP session.
+        """
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def send(self, url: str, body: bytes) -> dict:
+        """
+        Executes a webhook with the given message, within the rate limit bucket of the webhook.
+        :param url: The webhook url.
+        :param body: The encoded message body, see encode_embeds.
+        :return: The raw message data.
+        """
+        return await self._scheduler.call(url, lambda: self._post(url, url, body, params={'wait': 'true'}))
+
+    async def send_message(self, channel_id: int, body: bytes, headers: Dict[str, str]) -> dict:
+        """
+        Creates a message in a channel over the REST API, within the rate limit bucket of the channel. Unlike the
+        requests of discord.py, the rate limit headers of the response reach the bucket.
+        :param channel_id: The channel id.
+        :param body: The encoded message body, see encode_embeds.
+        :param headers: The authorization headers of the bot.
+        :return: The raw message data.
+        """
+        url = f'{Route.BASE}/channels/{channel_id}/messages'
+        return await self._scheduler.call(channel_id, lambda: self._post(channel_id, url, body, headers=headers))
+
+    async def _post(self, key: Hashable, url: str, body: bytes, **kwargs) -> dict:
+        """
+        Posts a message, and updates the rate limit bucket of its route from the response headers.
+        :param key: The route key, e.g. the channel id or the webhook url.
+        :param url: The request url.
+        :param body: The encoded message body.
+        :param kwargs: The other request arguments, e.g. the headers.
+        :return: The raw message data.
+        """
+        payload = BytesPayload(body, content_type='application/json')
+        async with self._session.post(url, data=payload, **kwargs) as response:
+            self._scheduler.bucket(key).update(response.headers)
+            data = await self._read(response)
+            if 200 <= response.status < 300:
+                return data
+            if response.status == 403:
+                raise Forbidden(response, data)
+            if response.status == 404:
+                raise NotFound(response, data)
+            raise HTTPException(response, data)
+
+    @staticmethod
+    async def _read(response: ClientResponse) -> Union[dict, str]:
+        """
+        Reads the response body, decoding it if it's JSON.
+        :param response: The webhook response.
+        :return: The decoded JSON data, or the raw text.
+        """
+        text = await response.text()
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text